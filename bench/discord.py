@@ -0,0 +1,69 @@
+"""
+Pushes a burst of embeds through DiscordNotifier against a local stand-in
+webhook that rate limits every few messages, and checks they arrive batched
+and in order.
+
+    python -m bench.discord --embeds 200
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from flagger.notify import DiscordNotifier, MAX_EMBEDS
+
+def make_handler(received: list, rate_limit_every: int):
+    lock = threading.Lock()
+    count = [0]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                count[0] += 1
+                limited = rate_limit_every and count[0] % rate_limit_every == 0
+                if not limited:
+                    received.append([e["description"] for e in body["embeds"]])
+            if limited:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.05")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embeds", type=int, default=200)
+    parser.add_argument("--rate-limit-every", type=int, default=5, help="answer every Nth message with a 429")
+    args = parser.parse_args()
+
+    received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(received, args.rate_limit_every))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/webhook"
+
+    notifier = DiscordNotifier()
+    start = time.perf_counter()
+    for i in range(args.embeds):
+        notifier.send(endpoint, {"description": str(i)})
+    enqueue_time = time.perf_counter() - start
+    notifier.close()
+    total_time = time.perf_counter() - start
+    server.shutdown()
+
+    delivered = [int(d) for batch in received for d in batch]
+    assert delivered == list(range(args.embeds)), "embeds lost or reordered"
+    assert all(len(batch) <= MAX_EMBEDS for batch in received)
+    print(f"enqueued {args.embeds} embeds in {enqueue_time * 1000:.1f} ms")
+    print(f"delivered in {len(received)} messages, {total_time:.2f}s total, {args.embeds / total_time:.0f} embeds/s")
+
+if __name__ == "__main__":
+    main()
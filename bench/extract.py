@@ -0,0 +1,139 @@
+"""
+Micro-benchmark of flag/context extraction over large synthetic documents,
+comparing the old per-match splitlines() scan with flagger.extract, then
+how scanning scales with the number of flag formats watched at once.
+
+Before timing anything, literal prefix derivation is checked on a few
+pinned patterns (it sits on the undocumented re parser) and the Extractor
+is checked against a plain finditer per format on random formats and
+texts, so a change that makes it miss or invent matches fails here.
+
+    python -m bench.extract --lines 200000 --flags 50
+    python -m bench.extract --formats 1 4 16 64
+    python -m bench.extract --check 20000
+"""
+import argparse
+import random
+import re
+import time
+from collections import Counter
+
+from flagger.extract import Extractor, literal_prefixes
+
+PATTERN = r"flag\{[^}]*\}"
+
+def legacy_extract(pattern: str, content: str):
+    out = []
+    r = re.compile(pattern)
+    for flag in r.findall(content):
+        lines = content.splitlines()
+        flag_line = -1
+        for i, line in enumerate(lines):
+            if flag in line:
+                flag_line = i
+                break
+        if flag_line != -1:
+            start = max(0, flag_line - 50)
+            end = min(len(lines), flag_line + 50)
+            out.append((flag, "\n".join(lines[start:end])))
+    return out
+
+def make_document(lines: int, flags: int, seed: int = 1337) -> str:
+    rng = random.Random(seed)
+    doc = [f"{i:08d} " + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz ", k=rng.randint(10, 100))) for i in range(lines)]
+    for n, i in enumerate(rng.sample(range(lines), flags)):
+        doc[i] += f" flag{{synthetic_{n}}}"
+    return "\n".join(doc)
+
+# pattern -> the literal prefixes its matches must start with, None if there are none
+PINNED_PREFIXES = {
+    r"flag\{[^}]*\}": ["flag{"],
+    r"(?:flag|ctf)\{.*?\}": ["ctf{", "flag{"],
+    r"(flag|CTF)\{(\w+)\}": ["CTF{", "flag{"],
+    r"\bctf\{\w+\}": ["ctf{"],
+    r"(?=c)ctf\{": ["ctf{"],
+    r"fl(?:ag)?\{": ["fl"],
+    r"(?:ab|cd)(?:ef|gh)\{": ["abef{", "abgh{", "cdef{", "cdgh{"],
+    # single characters become a class, which isn't expanded
+    r"(?:a|b)\{": None,
+    r"(flag|)\{": ["flag{", "{"],
+    r"(?i)flag\{": None,
+    r"(?i:flag)\{": None,
+    r"\w+\{\w+\}": None,
+    r"[fc]lag\{": None,
+    r"(?:flag)?\{": None,
+    r"\{": ["{"],
+}
+
+# building blocks of random formats, most with a literal prefix and some without
+_HEADS = ["flag", "ctf", "CTF", "ab", "(?:flag|ctf)", "(flag|ab)", "\\b", "(?=c)", "\\w+", "\\d+x", "[a-c]+", "x?", "(?i)ab", ""]
+_BODIES = ["\\{\\w+\\}", "\\{\\w*\\}", "\\{[^}]*\\}", "\\{(\\w+)\\}", "\\w+", "x", "12", "\\{.*?\\}"]
+_TEXT = ["flag", "ctf", "CTF", "ab", "12", "x", "{", "}", "{cd}", "_", " ", "\n", "c"]
+
+def reference(formats, text: str) -> Counter:
+    """
+    What every format matches in `text`, one finditer per format.
+    """
+    found = Counter()
+    for label, pattern in formats:
+        regex = re.compile(pattern)
+        group = 1 if regex.groups == 1 else 0
+        for match in regex.finditer(text):
+            if match.group(group):
+                found[label, pattern, match.group(group)] += 1
+    return found
+
+def check(cases: int, seed: int = 1337) -> None:
+    for pattern, prefixes in PINNED_PREFIXES.items():
+        assert literal_prefixes(pattern) == prefixes, f"literal_prefixes({pattern!r}) = {literal_prefixes(pattern)!r}, expected {prefixes!r}"
+    rng = random.Random(seed)
+    for _ in range(cases):
+        formats = []
+        for i in range(rng.randint(1, 4)):
+            pattern = rng.choice(_HEADS) + rng.choice(_BODIES)
+            try:
+                re.compile(pattern)
+            except re.error:
+                continue
+            formats.append((f"ctf{i % 3}", pattern))
+        text = "".join(rng.choices(_TEXT, k=rng.randint(0, 60)))
+        found = Counter((label, pattern, flag) for label, pattern, flag, _ in Extractor(formats).matches(text))
+        assert found == reference(formats, text), f"{formats!r} on {text!r}: {found!r} != {reference(formats, text)!r}"
+    print(f"check: {len(PINNED_PREFIXES)} pinned prefixes, {cases} random cases match finditer")
+
+def timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--flags", type=int, default=20)
+    parser.add_argument("--formats", type=int, nargs="+", default=[1, 2, 8, 32], help="numbers of formats to scan for at once, all but one decoys")
+    parser.add_argument("--check", type=int, default=5000, metavar="CASES", help="random format/text cases to check against finditer first")
+    args = parser.parse_args()
+
+    check(args.check)
+
+    doc = make_document(args.lines, args.flags)
+    print(f"document: {len(doc) / 1e6:.1f} MB, {args.lines} lines, {args.flags} flags")
+    extractor = Extractor(PATTERN)
+    legacy_time, legacy = timed(legacy_extract, PATTERN, doc)
+    new_time, new = timed(lambda d: [(flag, context.text()) for _, flag, context in extractor.extract(d)], doc)
+    assert legacy == new, "extraction results differ"
+    print(f"legacy:  {legacy_time * 1000:.1f} ms")
+    print(f"extract: {new_time * 1000:.1f} ms ({legacy_time / new_time:.1f}x)")
+
+    for n in args.formats:
+        formats = [("ctf", PATTERN)] + [(f"decoy{i}", rf"decoy{i}_ctf\{{[^}}]*\}}") for i in range(n - 1)]
+        extractor = Extractor(formats)
+        elapsed, found = timed(lambda d: [(flag, context.text()) for _, flag, context in extractor.extract(d)], doc)
+        assert found == new, "extraction results differ"
+        print(f"{n:>3} formats: {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares flagger.htmltext's extractors against BeautifulSoup's get_text()
+on a synthetic corpus of writeup-like pages (head scripts and styles,
+comments, pre blocks, entities, inline SVG with CDATA, junk after </html>,
+some with a flag), checking the text and
+the extracted flags/contexts match and timing each, plus how many pages
+DuckSniffer's raw-bytes prefilter lets skip parsing.
+
+    python -m bench.htmltext --pages 300
+"""
+import argparse
+import random
+import time
+
+from flagger.extract import Extractor
+from flagger.htmltext import EXTRACTORS, bs4_text
+from flagger.scan import worth_parsing
+
+FLAG_START = "bench{"
+PATTERN = r"bench\{[^}]*\}"
+WORDS = "lorem ipsum dolor sit amet writeup solve exploit payload offset &amp; &lt;tag&gt; caf&eacute; &#x41;".split()
+
+def make_page(rng: random.Random, n: int, flag_rate: float) -> str:
+    def words(k: int) -> str:
+        return " ".join(rng.choices(WORDS, k=k))
+    head = (f'<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n<title>Writeup {n}</title>\n'
+            '<style>\nbody { color: red; }\n</style>\n'
+            '<script>/* <![CDATA[ */ window.dataLayer = []; var f = "no flag in here"; /* ]]> */</script>\n</head>\n')
+    body = ['<body>\n<nav><ul><li><a href="/">Home</a></li>  <li><a href="/posts">Posts</a></li></ul></nav>\n<!-- comment -->\n<article>']
+    for _ in range(rng.randint(20, 200)):
+        kind = rng.random()
+        if kind < 0.1:
+            body.append(f"<pre><code>$ ./exploit\n  {words(10)}\n\n  {words(10)}\n</code></pre>")
+        elif kind < 0.2:
+            body.append(f"<h2>{words(4)}</h2>\n\n")
+        elif kind < 0.25:
+            body.append(f"<table>\n  <tr><td>{words(8)}</td> <td>{words(8)}</td></tr>\n</table>")
+        else:
+            body.append(f"<p>{words(rng.randint(5, 40))} <b>{words(3)}</b> <a href='#'>{words(2)}</a></p>")
+    if rng.random() < 0.05:
+        body.insert(rng.randrange(1, len(body)), f"<svg><style><![CDATA[ .a {{ fill: red }} ]]></style><text><![CDATA[{words(3)}]]></text></svg>")
+    if rng.random() < flag_rate:
+        body.insert(rng.randrange(1, len(body)), f"<p>the flag is <code>bench{{flag_{n}}}</code> for heap heaven</p>")
+    body.append("</article>\n<footer>&copy; 2026</footer>\n<script>console.log(1)</script>\n</body>\n</html>\n")
+    if rng.random() < 0.1:
+        # injected by some hosts and CMS plugins
+        body.append(f"<!-- cached -->\n<p>{words(5)}</p>\n")
+    return head + "\n".join(body)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--flag-rate", type=float, default=0.1, help="share of pages with a flag on them")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    pages = [make_page(rng, n, args.flag_rate) for n in range(args.pages)]
+    print(f"corpus: {args.pages} pages, {sum(map(len, pages)) / 1e6:.1f} MB")
+    extractor = Extractor(PATTERN)
+    found = lambda text: [(flag, context.text()) for _, flag, context in extractor.extract(text)]
+
+    start = time.perf_counter()
+    expected = [bs4_text(page) for page in pages]
+    bs4_time = time.perf_counter() - start
+    for name, html_to_text in EXTRACTORS.items():
+        if name == "bs4":
+            continue
+        try:
+            start = time.perf_counter()
+            texts = [html_to_text(page) for page in pages]
+            elapsed = time.perf_counter() - start
+        except ImportError as e:
+            print(f"{name:>7}: not available ({e})")
+            continue
+        same_text = sum(a == b for a, b in zip(texts, expected))
+        same_flags = sum(found(a) == found(b) for a, b in zip(texts, expected))
+        print(f"{name:>7}: {elapsed * 1000:7.0f} ms ({bs4_time / elapsed:4.1f}x bs4), "
+              f"text identical on {same_text}/{len(pages)}, flags and contexts on {same_flags}/{len(pages)}")
+    print(f"{'bs4':>7}: {bs4_time * 1000:7.0f} ms")
+
+    bodies = [page.encode() for page in pages]
+    start = time.perf_counter()
+    kept = [body for body in bodies if worth_parsing(body, "utf-8", FLAG_START, extractor)]
+    prefilter_time = time.perf_counter() - start
+    missed = sum(1 for body, text in zip(bodies, expected) if found(text) and body not in kept)
+    print(f"prefilter: {len(pages) - len(kept)}/{len(pages)} pages skipped in {prefilter_time * 1000:.1f} ms, {missed} pages with flags skipped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+End-to-end benchmark of the sniff -> classify pipeline, run offline against
+replayed fixtures (see flagger/fixtures.py). For each corpus size a
+synthetic GitHub + DuckDuckGo capture is generated and replayed through the
+real sniffers, classifier and flag store, measuring:
+
+  - regex extraction time and documents/sec through the Extractor alone
+  - batched classification time over the extracted contexts
+  - cycle latency, cold (nothing cached or seen) and warm (repeat cycle)
+  - documents/sec through the whole sniff stage
+
+Results are written as JSON named after the git commit, so runs on
+different commits can be compared with --compare.
+
+    python -m bench.pipeline --sizes 100 500 2000
+    python -m bench.pipeline --compare bench/results/<commit>.json
+    python -m bench.pipeline --cpu-workers 4
+    python -m bench.pipeline --duplicates 0.5
+
+--duplicates makes that share of the documents copies of earlier ones:
+GitHub forks with the same blob SHA, and web mirrors with different page
+chrome around the same text.
+
+A capture of a real cycle (`flagger config.json ctf --test --record DIR`)
+can be replayed instead of the synthetic corpus, in which case only the
+cycle is timed:
+
+    python -m bench.pipeline --replay DIR --config config.json --names ctf
+"""
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from flagger import fixtures, scan
+from flagger.classify import Classifier
+from flagger.extract import Extractor
+from flagger.sniffers import FlagConsolidator, formats_of
+
+NAME = "benchctf"
+CHALLENGES = ["baby rop", "heap heaven", "crypto casino", "web of lies", "rev me up", "pwn the planet", "stego saurus", "kernel panic"]
+WEBHOOK = "https://discord.invalid/api/webhooks/bench"
+FLAG_RATE = 0.2
+
+def bench_config(tmp: str, documents: int, cpu_workers: int = 0):
+    return {
+        "global": {
+            "keys": {"github": "bench", "discord_webhook": WEBHOOK},
+            "use_discord_webhook": False,
+            "db_path": os.path.join(tmp, "flagger.sqlite"),
+            "cache_path": os.path.join(tmp, "cache.sqlite"),
+            "dedupe_path": os.path.join(tmp, "fingerprints.sqlite"),
+            "state_dir": tmp,
+            "github_incremental": False,
+            "github_max_pages": documents // 100 + 1,
+            "cpu_workers": cpu_workers,
+        },
+        NAME: {
+            "search": NAME,
+            "flag_start": "bench{",
+            "flag_re": r"bench\{[^}]*\}",
+            "start": "2026-01-01T00:00:00Z",
+            "backend": {"type": "other"},
+            "challenges": CHALLENGES,
+            "use_llm": False,
+        },
+    }
+
+def make_document(rng: random.Random, n: int, lines: int) -> str:
+    words = "lorem ipsum dolor sit amet writeup solve exploit payload offset".split()
+    doc = [" ".join(rng.choices(words, k=rng.randint(4, 16))) for _ in range(lines)]
+    if rng.random() < FLAG_RATE:
+        at = rng.randrange(lines)
+        doc[at] += f" bench{{synthetic_{n}}}"
+        doc[max(0, at - 3)] += f" ## {rng.choice(CHALLENGES)}"
+    return "\n".join(doc)
+
+def make_corpus(path: str, config, documents: int, lines: int, seed: int = 1337, duplicates: float = 0.0):
+    """
+    Writes a capture of one cycle over `documents` documents, half of them
+    GitHub search hits and half DuckDuckGo results, `duplicates` of each half
+    copies of an earlier document in it. Returns the document texts.
+    """
+    rng = random.Random(seed)
+    ctf = config[NAME]
+    capture = fixtures.Fixtures(path, "record")
+    texts = []
+    for n in range(documents):
+        first = 0 if n < documents // 2 else documents // 2
+        if n > first and rng.random() < duplicates:
+            texts.append(texts[rng.randrange(first, n)])
+        else:
+            texts.append(make_document(rng, n, lines))
+    github, web = texts[:documents // 2], texts[documents // 2:]
+
+    json_headers = {"Content-Type": "application/json; charset=utf-8"}
+    query = quote(f"{ctf['search']} {ctf['flag_start']} ", safe='')
+    items = []
+    for n, text in enumerate(github):
+        repo, path_ = f"bench/repo{n}", f"writeups/{n}.md"
+        items.append({"repository": {"full_name": repo}, "path": path_, "sha": hashlib.sha1(text.encode()).hexdigest(), "html_url": f"https://github.com/{repo}/blob/main/{path_}"})
+        commits = [{"commit": {"committer": {"date": "2026-02-01T00:00:00Z"}}}]
+        capture.record("GET", f"https://api.github.com/repos/{repo}/commits?path={quote(path_, safe='')}&per_page=1", 200, json_headers, json.dumps(commits).encode())
+        content = {"content": base64.b64encode(text.encode()).decode()}
+        capture.record("GET", f"https://api.github.com/repos/{repo}/contents/{path_}", 200, json_headers, json.dumps(content).encode())
+    for page in range(1, len(items) // 100 + 2):
+        body = {"total_count": len(items), "items": items[(page - 1) * 100:page * 100]}
+        capture.record("GET", f"https://api.github.com/search/code?q={query}&per_page=100&page={page}", 200, json_headers, json.dumps(body).encode())
+
+    results = []
+    for n, text in enumerate(web):
+        url = f"https://bench.invalid/page/{n}"
+        # the shape duckduckgo_search returns
+        results.append({"title": f"page {n}", "href": url, "body": ""})
+        # mirrors of the same text differ in their page chrome
+        html = f"<html><head><script>var x = {n};</script></head><body><div class='header'>mirror {n}</div>" + "".join(f"<p>{line}</p>\n" for line in text.splitlines()) + "</body></html>"
+        headers = {"Content-Type": "text/html; charset=utf-8", "ETag": f'"{n}"'}
+        capture.record("GET", url, 200, headers, html.encode())
+    capture.record_search("duckduckgo", f"{ctf['search']} {ctf['flag_start']}", results)
+    # unknown challenges are always reported
+    capture.record("POST", WEBHOOK, 204, {}, b"")
+    return texts
+
+def best_of(fn, repeat: int):
+    best, res = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+def run_cycles(config, names, tmp: str, cycles: int = 2):
+    """
+    Seconds taken by each of `cycles` consecutive cycles through the real
+    sniffers and handle_flags, and how many new flags the first one reported.
+    """
+    import flagger.__main__ as app
+    cwd = os.getcwd()
+    # flags.txt, log.txt and friends land in tmp
+    os.chdir(tmp)
+    quiet = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+            glob = config["global"]
+            ctfs = app.load_ctfs(config, names)
+            sniffers = app.load_sniffers(glob, ctfs)
+            times, found = [], []
+            for _ in range(cycles):
+                start = time.perf_counter()
+                consolidator, new = FlagConsolidator(), 0
+                for flag in app.stream_flags(sniffers, glob):
+                    flag = consolidator.add(flag)
+                    if flag is not None:
+                        new += app.handle_flags([flag], ctfs, glob)
+                times.append(time.perf_counter() - start)
+                found.append(new)
+            if app.NOTIFIER is not None:
+                app.NOTIFIER.close()
+    finally:
+        os.chdir(cwd)
+        if app.STORE is not None:
+            app.STORE.close()
+        for f in app.OPEN_FILES.values():
+            f.close()
+        app.STORE, app.NOTIFIER = None, None
+        app.OPEN_FILES.clear()
+    return times, found[0]
+
+def bench_size(documents: int, lines: int, repeat: int, cpu_workers: int = 0, duplicates: float = 0.0):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = bench_config(tmp, documents, cpu_workers)
+        capture = os.path.join(tmp, "capture")
+        texts = make_corpus(capture, config, documents, lines, duplicates=duplicates)
+        size = sum(len(text) for text in texts)
+
+        extractor = Extractor(formats_of({**config[NAME], "name": NAME}))
+        extract_time, matches = best_of(lambda: [(flag, context.text()) for text in texts for _, flag, context in extractor.extract(text)], repeat)
+        classifier = Classifier(CHALLENGES)
+        contexts = [context for _, context in matches]
+        classify_time, _ = best_of(lambda: classifier.classify(contexts), repeat)
+
+        fixtures.use(capture, "replay")
+        try:
+            (cold, warm), flags = run_cycles(config, [NAME], tmp)
+        finally:
+            fixtures.stop()
+            scan.shutdown()
+        unique = len({flag for flag, _ in matches})
+        if flags != unique:
+            print(f"warning: cycle reported {flags} flags, extraction found {unique}", file=sys.stderr)
+
+    return {
+        "documents": documents,
+        "megabytes": round(size / 1e6, 3),
+        "flags": len(matches),
+        "extract_s": extract_time,
+        "extract_docs_per_s": documents / extract_time,
+        "classify_s": classify_time,
+        "classify_flags_per_s": len(contexts) / classify_time if contexts else None,
+        "cycle_cold_s": cold,
+        "cycle_warm_s": warm,
+        "sniff_docs_per_s": documents / cold,
+    }
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], check=True, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+def compare(results, other_path: str):
+    with open(other_path, "r") as f:
+        other = json.load(f)
+    print(f"\nvs {other['commit']}{' (dirty)' if other['dirty'] else ''}, lower is better:")
+    for size, metrics in results["sizes"].items():
+        before = other["sizes"].get(size)
+        if before is None:
+            continue
+        ratios = ", ".join(f"{k} {metrics[k] / before[k]:.2f}x" for k in metrics if k.endswith("_s") and before.get(k))
+        print(f"  {size:>6} docs: {ratios}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000], help="documents per synthetic corpus")
+    parser.add_argument("--lines", type=int, default=200, help="lines per document")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cpu-workers", type=int, default=0, help="scan documents in a process pool of this size")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="share of documents that are forks or mirrors of another")
+    parser.add_argument("--out", default=os.path.join("bench", "results"), help="directory the results JSON is written to")
+    parser.add_argument("--compare", metavar="RESULTS", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--replay", metavar="DIR", help="time cycles over a capture made with flagger --record")
+    parser.add_argument("--config", type=argparse.FileType("r"), help="config the capture was recorded with")
+    parser.add_argument("--names", nargs="+", help="ctf names the capture was recorded for")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "cpu_workers": args.cpu_workers,
+        "duplicates": args.duplicates,
+        "sizes": {},
+    }
+    if args.replay:
+        if not args.config or not args.names:
+            parser.error("--replay needs --config and --names")
+        config = json.load(args.config)
+        with tempfile.TemporaryDirectory() as tmp:
+            # don't touch the real flag store, cache or cursors
+            config["global"].update({"db_path": os.path.join(tmp, "flagger.sqlite"), "cache_path": os.path.join(tmp, "cache.sqlite"), "dedupe_path": os.path.join(tmp, "fingerprints.sqlite"), "state_dir": tmp, "use_discord_webhook": False})
+            if args.cpu_workers:
+                config["global"]["cpu_workers"] = args.cpu_workers
+            for name in args.names:
+                config[name]["use_llm"] = False
+            fixtures.use(os.path.abspath(args.replay), "replay")
+            try:
+                (cold, warm), flags = run_cycles(config, args.names, tmp)
+            finally:
+                scan.shutdown()
+        results["replay"] = {"capture": args.replay, "flags": flags, "cycle_cold_s": cold, "cycle_warm_s": warm}
+        print(f"{args.replay}: {flags} flags, cold cycle {cold * 1000:.0f} ms, warm cycle {warm * 1000:.0f} ms")
+    else:
+        for documents in args.sizes:
+            metrics = results["sizes"][str(documents)] = bench_size(documents, args.lines, args.repeat, args.cpu_workers, args.duplicates)
+            print(f"{documents:>6} docs ({metrics['megabytes']:.1f} MB, {metrics['flags']} flags): "
+                  f"extract {metrics['extract_s'] * 1000:.1f} ms ({metrics['extract_docs_per_s']:.0f} docs/s), "
+                  f"classify {metrics['classify_s'] * 1000:.1f} ms, "
+                  f"cycle {metrics['cycle_cold_s'] * 1000:.0f} ms cold / {metrics['cycle_warm_s'] * 1000:.0f} ms warm "
+                  f"({metrics['sniff_docs_per_s']:.0f} docs/s)")
+
+    os.makedirs(args.out, exist_ok=True)
+    out = os.path.join(args.out, f"{commit}{'-dirty' if dirty else ''}.json")
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
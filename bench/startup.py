@@ -0,0 +1,47 @@
+"""
+Cold start benchmark: how long `import flagger.__main__` takes in a fresh
+interpreter, and which modules cost the most according to -X importtime.
+
+    python -m bench.startup --runs 10 --top 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+def cold_import(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - start
+
+def import_times(module: str):
+    """
+    (cumulative µs, module) for every import, slowest first.
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], check=True, capture_output=True, text=True)
+    times = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative), name.strip()))
+    return sorted(times, reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="flagger.__main__")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    baseline = [cold_import("sys") for _ in range(args.runs)]
+    runs = [cold_import(args.module) for _ in range(args.runs)]
+    print(f"interpreter: {statistics.median(baseline) * 1000:.0f} ms")
+    print(f"{args.module}: {statistics.median(runs) * 1000:.0f} ms median, {min(runs) * 1000:.0f} ms best over {args.runs} runs")
+    print("slowest imports:")
+    for cumulative, name in import_times(args.module)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares a sequential bare `requests.get` crawl against DuckSniffer's pooled,
+capped fetch stage, using a local HTTP server as a stand-in for result pages.
+
+    python -m bench.web_fetch --pages 100 --latency 0.2
+"""
+import argparse
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from flagger.net import make_session, fetch_capped
+
+def make_handler(latency: float, size: int):
+    body = (b"<html><body><p>" + b"lorem ipsum dolor sit amet " * (size // 27) + b"</p></body></html>")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.1, help="server-side delay per page, in seconds")
+    parser.add_argument("--size", type=int, default=512 * 1024, help="page size in bytes")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-bytes", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency, args.size))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/page/{i}" for i in range(args.pages)]
+
+    start = time.perf_counter()
+    sequential = 0
+    for url in urls:
+        sequential += len(requests.get(url).content)
+    seq_time = time.perf_counter() - start
+
+    session = make_session(args.workers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        pooled = sum(len(fetched.body) for fetched in pool.map(lambda u: fetch_capped(session, u, args.max_bytes), urls))
+    pool_time = time.perf_counter() - start
+
+    server.shutdown()
+    print(f"sequential: {seq_time:.2f}s, {args.pages / seq_time:.1f} pages/s, {sequential / 1e6:.1f} MB")
+    print(f"pooled:     {pool_time:.2f}s, {args.pages / pool_time:.1f} pages/s, {pooled / 1e6:.1f} MB")
+    print(f"speedup:    {seq_time / pool_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,248 +1,450 @@
 import sys
 import json
 import argparse
-import schedule
-import time
-from tqdm import tqdm
-import requests
-from ollama import chat
-from ollama import ChatResponse
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterator, List, Optional, Dict, Any, TextIO, Tuple, TYPE_CHECKING
+from dataclasses import dataclass
 from .sniffers import *
 from .backends import *
-from textwrap import dedent
-from rapidfuzz import fuzz
+from .classify import Classifier, Classification
+from . import metrics, scan
+from .sampler import Sampler
+from .scheduler import Scheduler
+from .store import FlagStore, DEFAULT_DB_PATH
 import datetime
 from .globals import VERSION
 import traceback
-import os
+import signal
+import time
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
+
+if TYPE_CHECKING:
+    from .llm import LlmQueue
+    from .notify import DiscordNotifier
+
+STORE: Optional[FlagStore] = None
+# ollama and the webhook client are imported on first use, most runs never need one of them
+LLM_QUEUE: Optional["LlmQueue"] = None
+NOTIFIER: Optional["DiscordNotifier"] = None
+
+@dataclass
+class Ctf:
+    name: str
+    config: Dict[str, Any]
+    backend: Optional[Backend]
+    # used when there's no backend to fetch the challenge list from
+    challenges: Optional[List[str]]
+    _classifier: Optional[Classifier] = None
 
-FOUND_THIS_SESSION = set()
+    def classifier(self, global_config: Dict[str, Any]) -> Classifier:
+        """
+        Classifier over the current challenge list, only rebuilt when the list
+        changes. Backends cache the list, so this doesn't hit the scoreboard
+        for every flag.
+        """
+        challenges = self.backend.get_challenges() if self.backend else self.challenges
+        if self._classifier is None or self._classifier.challenges != challenges:
+            # rapidfuzz's cdist scores on its own threads outside the GIL
+            self._classifier = Classifier(challenges, global_config.get("fuzz_workers", global_config.get("cpu_workers") or 1))
+        return self._classifier
+
+# kept open for the whole run instead of reopened for every flag
+OPEN_FILES: Dict[str, TextIO] = {}
+
+def append_line(path: str, line: str):
+    f = OPEN_FILES.get(path)
+    if f is None:
+        f = OPEN_FILES[path] = open(path, "a", buffering=1)
+    f.write(line + "\n")
 
 def log_to_file(msg: str):
-    with open("log.txt", "a") as f:
-        f.write(msg + "\n")
+    append_line("log.txt", msg)
+
+def flag_store(global_config: Dict[str, Any]) -> FlagStore:
+    global STORE
+    if STORE is None:
+        STORE = FlagStore(global_config.get("db_path", DEFAULT_DB_PATH))
+    return STORE
+
+def notifier() -> "DiscordNotifier":
+    global NOTIFIER
+    if NOTIFIER is None:
+        from .notify import DiscordNotifier
+        NOTIFIER = DiscordNotifier()
+    return NOTIFIER
 
-def discord_embed(chall: str, url: str, flag: str, endpoint: str, ctf: str) -> None:
-    data = {
-        "embeds": [
+def format_field(embed: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+    # only set for CTFs watching several formats
+    if fmt:
+        embed["fields"].append({"name": "Flag format:", "value": f"`{fmt}`"})
+    return embed
+
+def discord_embed(chall: str, url: str, flag: str, endpoint: str, ctf: str, fmt: str = "", on_sent: Optional[Callable[[], None]] = None) -> None:
+    embed = {
+        "title": "Potential flag found!",
+        "description": f"```\n{flag}\n```",
+        "color": 4321431,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "footer": {
+            "text": "flagger " + VERSION
+        },
+        "fields": [
+            {
+                "name": "For chall:",
+                "value": chall
+            },
             {
-                "title": "Potential flag found!",
-                "description": f"```\n{flag}\n```",
-                "color": 4321431,
-                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "footer": {
-                    "text": "flagger " + VERSION
-                },
-                "fields": [
-                    {
-                        "name": "For chall:",
-                        "value": chall
-                    },
-                    {
-                        "name": "From URL:",
-                        "value": url
-                    },
-                    {
-                        "name": "For CTF:",
-                        "value": ctf
-                    }
-                ]
+                "name": "From URL:",
+                "value": url
+            },
+            {
+                "name": "For CTF:",
+                "value": ctf
             }
         ]
     }
-    requests.post(endpoint, json=data)
+    notifier().send(endpoint, format_field(embed, fmt), on_sent)
     
-def discord_small_embed(title: str, url: str, flag: str, endpoint: str, ctf: str) -> None:
-    data = {
-        "embeds": [
+def discord_small_embed(title: str, url: str, flag: str, endpoint: str, ctf: str, fmt: str = "") -> None:
+    embed = {
+        "title": title,
+        "description": f"```\n{flag}\n```",
+        "color": 4321431,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "footer": {
+            "text": "flagger " + VERSION
+        },
+        "fields": [
+            {
+                "name": "From URL:",
+                "value": url
+            },
             {
-                "title": title,
-                "description": f"```\n{flag}\n```",
-                "color": 4321431,
-                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "footer": {
-                    "text": "flagger " + VERSION
-                },
-                "fields": [
-                    {
-                        "name": "From URL:",
-                        "value": url
-                    },
-                    {
-                        "name": "For CTF:",
-                        "value": ctf
-                    }
-                ]
+                "name": "For CTF:",
+                "value": ctf
             }
         ]
     }
-    requests.post(endpoint, json=data)
+    notifier().send(endpoint, format_field(embed, fmt))
 
 def discord_status_embed(msg: str, endpoint: str) -> None:
-    data = {
-        "embeds": [
-            {
-                "title": "valgrind flagger status",
-                "description": msg,
-                "color": 4321431,
-                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "footer": {
-                    "text": "flagger " + VERSION
-                }
-            }
-        ]
+    embed = {
+        "title": "valgrind flagger status",
+        "description": msg,
+        "color": 4321431,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "footer": {
+            "text": "flagger " + VERSION
+        }
     }
-    requests.post(endpoint, json=data)
+    notifier().send(endpoint, embed)
 
-def log_flag(flag: Flag, config: Dict[str, Any], challenges: List[str], global_config: Dict[str, Any], name: str):
-    if flag.flag in FOUND_THIS_SESSION:
-        return
-    with open("flags.txt", "a") as f:
-        f.write(flag.flag + "\n")
-        # try a text match first
-        matches = []
-        for challenge in challenges:
-            if flag.context.lower().find(challenge.lower()) != -1:
-                # append one for each occurence
-                for _ in range(flag.context.lower().count(challenge.lower())):
-                    matches.append(challenge)
-        for challenge in challenges:
-            if fuzz.ratio(flag.context, challenge) > 80:
-                matches.append(challenge)
-                break
-        if (not matches or len(matches) > 1) and config['use_llm'] == True:
-            matches = []
-            for _ in range(2): # 2 attempts to get a valid result
-                print(" Falling back to LLM to classify...")
-                response: ChatResponse = chat(model='dolphin-mistral', messages=[
-                    {
-                        'role': 'system',
-                        'content': 'You are a helpful assistant chatbot for CTF competitions.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': dedent(f"""Here is a flag and its context:
-
-                                              ```plaintext
-                                              Flag: {flag.flag}
-                                              Origin: {flag.origin}
-                                              Context: 
-                                              {flag.context}
-                                              ```
-
-                                              Here is a list of challenges:
-                                              ```plaintext
-                                              {", ".join(challenges)}
-                                              ```
-
-                                              Out of the list of challenges, provide ONE challenge that you think this flag belongs to. Respond ONLY with the challenge name in a code block, do not include any other information. Eg:
-
-                                              ```
-                                              {challenges[0]}
-                                              ```
-
-                                              or
-
-                                              ```
-                                              {challenges[1]}
-                                              ```
-
-                                              etc...
-
-                                              If it does not seem to match, respond with "FALSE POSITIVE" in a code block instead.
-                                              """)
-                    },
-                ])
-                msg = response.message.content
-                for challenge in challenges:
-                    if challenge.lower() in msg.lower():
-                        matches.append(challenge)
-                        break
-                if "FALSE POSITIVE" in msg or matches:
-                    break
-        if not matches:
-            log_to_file(f"Flag: {flag.flag} Origin: {flag.origin} Challenge: Unknown")
-            discord_embed("Unknown challenge", flag.origin, flag.flag, global_config['keys']['discord_webhook'], name)
+def report_flag(flag: Flag, challenge: Optional[str], global_config: Dict[str, Any], name: str, late: bool = False):
+    store = flag_store(global_config)
+    store.set_challenge(name, flag.flag, challenge)
+    found = f"Flag: {flag.flag} Origin: {flag.origin}" + (f" Format: {flag.format}" if flag.format else "")
+    # a flag only counts as reported once its notification is out, see FlagStore.unreported
+    reported = lambda: store.mark_reported(name, flag.flag)
+    if late:
+        log_to_file(f"{found} Challenge: {challenge} (reclassified)")
+        if global_config['use_discord_webhook']:
+            discord_small_embed(f"Reclassified as {challenge}", flag.origin, flag.flag, global_config['keys']['discord_webhook'], name, flag.format)
+    elif not challenge:
+        log_to_file(f"{found} Challenge: Unknown")
+        if global_config['use_discord_webhook']:
+            discord_embed("Unknown challenge", flag.origin, flag.flag, global_config['keys']['discord_webhook'], name, flag.format, reported)
         else:
-            # sort matches by how many times they appear in the context
-            matches.sort(key=lambda challenge: flag.context.lower().count(challenge.lower()), reverse=True)
-            log_to_file(f"Flag: {flag.flag} Origin: {flag.origin} Challenge: {matches[0] if matches else 'Unknown'}")
-            if global_config['use_discord_webhook']:
-                discord_embed(matches[0], flag.origin, flag.flag, global_config['keys']['discord_webhook'], name)
-        FOUND_THIS_SESSION.add(flag.flag)
-
-def dispatch(sniffers: List[Sniffer], backend: Optional[Backend], challenges: Optional[List[str]], global_config: Dict[str, Any], name: str):
-    print("Searching...")
-    flags = []
-    for sniffer in tqdm(sniffers):
+            reported()
+    else:
+        log_to_file(f"{found} Challenge: {challenge}")
+        if global_config['use_discord_webhook']:
+            discord_embed(challenge, flag.origin, flag.flag, global_config['keys']['discord_webhook'], name, flag.format, reported)
+        else:
+            reported()
+
+def llm_queue(global_config: Dict[str, Any]) -> "LlmQueue":
+    global LLM_QUEUE
+    if LLM_QUEUE is None:
+        from .llm import LlmQueue
+        LLM_QUEUE = LlmQueue(global_config)
+    return LLM_QUEUE
+
+def log_flag(flag: Flag, config: Dict[str, Any], challenges: List[str], global_config: Dict[str, Any], name: str, classification: Optional[Classification] = None, resume: bool = False):
+    """
+    Stores and reports a newly found flag. With `resume`, the flag was
+    stored by an earlier run that never got to report it.
+    """
+    if not resume:
+        if not flag_store(global_config).add(name, flag.flag, flag.origin, flag.context, flag.format):
+            return
+        metrics.inc("flagger_flags_logged_total", ctf=name)
+        append_line("flags.txt", flag.flag)
+    if classification is None:
+        classification = Classifier(challenges).classify([flag.context])[0]
+    # text matches (one per occurrence) first, then the best fuzzy match
+    matches = list(classification.matches)
+    if (not matches or len(matches) > 1) and config['use_llm'] == True:
+        # reported from LlmQueue.drain() once the model answers or times out
+        llm_queue(global_config).submit(flag, challenges, lambda flag, challenge, late: report_flag(flag, challenge, global_config, name, late))
+        return
+    # sort matches by how many times they appear in the context
+    matches.sort(key=lambda challenge: classification.counts.get(challenge, 0), reverse=True)
+    report_flag(flag, matches[0] if matches else None, global_config, name)
+
+def stream_flags(sniffers: List[Sniffer], global_config: Dict[str, Any]) -> Iterator[Flag]:
+    """
+    Yields flags from every sniffer as they're found.
+    """
+    if not global_config.get("concurrent", True) or len(sniffers) < 2:
+        for sniffer in sniffers:
+            try:
+                yield from sniffer.sniff()
+            except Exception as e:
+                print(f"Error in {sniffer.__class__.__name__}: {e}")
+                traceback.print_exc()
+                continue
+        return
+    timeout = global_config.get("sniffer_timeout")
+    deadline = time.time() + timeout if timeout else None
+    queue: Queue = Queue()
+
+    def pump(sniffer: Sniffer):
         try:
-            flags += sniffer.sniff()
+            for flag in sniffer.sniff():
+                queue.put(flag)
         except Exception as e:
             print(f"Error in {sniffer.__class__.__name__}: {e}")
-            traceback.print_exc()
-            continue
+            traceback.print_exception(e)
+        finally:
+            queue.put(sniffer)
+
+    pool = ThreadPoolExecutor(max_workers=global_config.get("max_workers", len(sniffers)), thread_name_prefix="sniffer")
+    for sniffer in sniffers:
+        sniffer.stopping.clear()
+        pool.submit(pump, sniffer)
+    running = set(sniffers)
+    try:
+        while running:
+            try:
+                item = queue.get(timeout=None if deadline is None else max(0, deadline - time.time()))
+            except Empty:
+                for sniffer in running:
+                    print(f"Error in {sniffer.__class__.__name__}: timed out after {timeout}s")
+                return
+            if isinstance(item, Sniffer):
+                running.discard(item)
+            else:
+                yield item
+    finally:
+        # don't block the cycle, or exiting, on a sniffer that blew through its timeout
+        for sniffer in running:
+            sniffer.stop()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def dispatch(sniffers: List[Sniffer], ctfs: Dict[str, Ctf], global_config: Dict[str, Any]):
+    print("Searching...")
+    consolidator = FlagConsolidator()
+    # handle every flag as soon as it comes in instead of after the slowest sniffer
+    for flag in stream_flags(sniffers, global_config):
+        flag = consolidator.add(flag)
+        if flag is not None:
+            handle_flags([flag], ctfs, global_config)
+            for sniffer in sniffers:
+                sniffer.handled([flag])
+    if LLM_QUEUE is not None:
+        LLM_QUEUE.drain()
+
+def handle_flags(flags: List[Flag], ctfs: Dict[str, Ctf], global_config: Dict[str, Any]) -> int:
+    """
+    Classifies and reports the flags not seen before, returning how many there were.
+    """
     flags = consolidate_flags(flags)
-    for flag in tqdm(flags):
-        log_flag(flag, sniffer.config, backend.get_challenges() if backend else challenges, global_config, name)
+    store = flag_store(global_config)
+    # sniffers may be shared between CTFs, route every flag to the one whose format it matched
+    by_ctf: Dict[str, List[Flag]] = {}
+    for flag in flags:
+        if flag.ctf in ctfs and not store.seen(flag.ctf, flag.flag):
+            by_ctf.setdefault(flag.ctf, []).append(flag)
+    for name, ctf_flags in by_ctf.items():
+        classify_and_log(ctf_flags, ctfs[name], global_config)
+    return sum(len(ctf_flags) for ctf_flags in by_ctf.values())
 
-def main():
-    parser = argparse.ArgumentParser(description="valgrind's internal flag sniffer (what, me? unethical? never...)")
-    parser.add_argument('config', type=argparse.FileType('r'), help='path to the config file')
-    parser.add_argument('name', help='name of the ctf to sniff for')
-    parser.add_argument('-t', "--test", action="store_true", help="run all sniffers once and exit")
-    args = parser.parse_args()
-    config = json.load(args.config)
-    if not args.name in config:
-        print(f"CTF {args.name} not found in config")
-        sys.exit(1)
-    glob = config["global"]
-    config = config[args.name]
-    print("Loading sniffers...")
-    sniffers = []
-    for sniffer in ALL_SNIFFERS:
-        sniffers.append(sniffer(glob, config))
+def drain_llm():
+    if LLM_QUEUE is not None:
+        LLM_QUEUE.drain(block=False)
+
+def classify_and_log(flags: List[Flag], ctf: Ctf, global_config: Dict[str, Any], resume: bool = False):
+    # one batched classification pass over everything that arrived together
+    classifier = ctf.classifier(global_config)
+    with metrics.timer("flagger_stage_seconds", stage="classify"):
+        classifications = classifier.classify([flag.context for flag in flags])
+    for flag, classification in zip(flags, classifications):
+        log_flag(flag, ctf.config, classifier.challenges, global_config, ctf.name, classification, resume)
+
+def resume_unreported(ctfs: Dict[str, Ctf], global_config: Dict[str, Any]):
+    """
+    Reports flags an earlier run stored but died before reporting, e.g. while
+    they waited on the LLM or sat in the Discord queue.
+    """
+    for ctf in ctfs.values():
+        flags = [Flag(flag, origin, context, ctf.name, fmt) for flag, origin, context, fmt in flag_store(global_config).unreported(ctf.name)]
+        if not flags:
+            continue
+        print(f"Reporting {len(flags)} flag(s) for {ctf.name} left unreported by the last run...")
+        try:
+            classify_and_log(flags, ctf, global_config, resume=True)
+        except Exception as e:
+            # they stay unreported and are tried again next start
+            print(f"Error reporting flags for {ctf.name}: {e}")
+            traceback.print_exception(e)
+
+def handle_sigterm(signum, frame):
+    # shut down the same way as Ctrl+C so queued notifications get flushed
+    raise KeyboardInterrupt
+
+def load_backend(config: Dict[str, Any]) -> Optional[Backend]:
     print("Using backend: " + config["backend"]["type"])
     backend: Optional[Backend] = None
-    match config["backend"]["type"]:
+    ttl = config["backend"].get("challenges_ttl", CHALLENGES_TTL)
+    backend_type = config["backend"]["type"]
+    match backend_type:
         case "other":
             print("config.challenges should be updated with a list of strings for each challenge's name.")
         case "ctfd":
-            backend = CtfdBackend(config["backend"]["url"], config["backend"]["token"])
+            backend = BACKENDS.load("ctfd")(config["backend"]["url"], config["backend"]["token"], challenges_ttl=ttl)
         case "0ctf":
-            backend = ZeroCtfBackend(config["backend"]["url"]) 
+            backend = BACKENDS.load("0ctf")(config["backend"]["url"], challenges_ttl=ttl)
         case "ctfx":
-            backend = CtfxBackend(config["backend"]["url"], config["backend"]["username"], config["backend"]["password"])
+            backend = BACKENDS.load("ctfx")(config["backend"]["url"], config["backend"]["username"], config["backend"]["password"], challenges_ttl=ttl)
+        case _ if backend_type in BACKENDS.names():
+            # plugin backends take the Backend constructor's (url, token)
+            backend = BACKENDS.load(backend_type)(config["backend"]["url"], config["backend"].get("token"))
         case _:
             print("Invalid backend type")
             sys.exit(1)
     if backend is None and not config.get("challenges"):
         print("No backend or challenges found. Please update config.challenges to contain a list of strings for each challenge's name.")
         sys.exit(1)
-    print(f"Sniffing for {args.name} with flag format r'{config['flag_re']}'...")
-    if glob['use_discord_webhook']:
-        discord_status_embed(f"starting up for ctf {args.name}, flag format: \n```\n{config['flag_re']}\n```", glob['keys']['discord_webhook'])
-    # load previously found flags
-    if os.path.exists(f"flags_found_{args.name}.txt"):
-        with open(f"flags_found_{args.name}.txt", "r") as f:
-            for line in f:
-                FOUND_THIS_SESSION.add(line.strip())
+    return backend
+
+def merge_configs(ctfs: List[Ctf]) -> List[Dict[str, Any]]:
+    """
+    The sniffer config shared by every CTF watched. Each distinct search
+    query is run once, and whatever the searches turn up goes through one
+    fetch and scan stage, so a document found for several CTFs is fetched
+    once and scanned for all of their flag formats at once.
+    """
+    if len(ctfs) == 1:
+        return [ctfs[0].config]
+    queries: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    for ctf in ctfs:
+        key = (" ".join(ctf.config["search"].lower().split()), ctf.config["flag_start"])
+        queries.setdefault(key, (ctf.config["search"], ctf.config["flag_start"]))
+    return [{
+        **ctfs[0].config,
+        "name": "+".join(ctf.name for ctf in ctfs),
+        # timestamps are ISO 8601, so they sort as strings
+        "start": min(ctf.config["start"] for ctf in ctfs),
+        # each CTF only takes flags from files changed after its own start
+        "starts": {ctf.name: ctf.config["start"] for ctf in ctfs},
+        "formats": [fmt for ctf in ctfs for fmt in formats_of(ctf.config)],
+        "queries": list(queries.values()),
+    }]
+
+def load_ctfs(config: Dict[str, Any], names: List[str]) -> Dict[str, Ctf]:
+    ctfs: Dict[str, Ctf] = {}
+    for name in names:
+        ctf_config = config[name]
+        # flags are labelled, and routed back to their CTF, by this name
+        ctf_config["name"] = name
+        ctfs[name] = Ctf(name, ctf_config, load_backend(ctf_config), ctf_config.get("challenges"))
+    return ctfs
+
+def load_sniffers(glob: Dict[str, Any], ctfs: Dict[str, Ctf]) -> List[Sniffer]:
+    print("Loading sniffers...")
+    # only the sniffers the config enables get imported
+    sniffer_classes = []
+    for sniffer_name in glob.get("sniffers", DEFAULT_SNIFFERS):
+        try:
+            sniffer_classes.append(SNIFFERS.load(sniffer_name))
+        except KeyError as e:
+            print(e.args[0])
+            sys.exit(1)
+    sniffers = []
+    for sniffer_config in merge_configs(list(ctfs.values())):
+        for sniffer in sniffer_classes:
+            sniffers.append(sniffer(glob, sniffer_config))
+    return sniffers
+
+def main():
+    parser = argparse.ArgumentParser(description="valgrind's internal flag sniffer (what, me? unethical? never...)")
+    parser.add_argument('config', type=argparse.FileType('r'), help='path to the config file')
+    parser.add_argument('names', nargs='+', metavar='name', help='name(s) of the ctf(s) to sniff for; several run in one process, with each distinct search run once and every result fetched once and scanned for all of their flag formats')
+    parser.add_argument('-t', "--test", action="store_true", help="run all sniffers once and exit")
+    parser.add_argument("--profile", action="store_true", help="run all sniffers once under a sampling profiler, print the hottest code paths and stage timings, and exit")
+    parser.add_argument("--profile-out", metavar="FILE", help="with --profile, also write the sampled stacks to FILE in collapsed (flamegraph) format")
+    fixture_args = parser.add_mutually_exclusive_group()
+    fixture_args.add_argument("--record", metavar="DIR", help="save every HTTP response and search result to DIR")
+    fixture_args.add_argument("--replay", metavar="DIR", help="answer requests from a directory saved with --record instead of the network")
+    args = parser.parse_args()
+    config = json.load(args.config)
+    for name in args.names:
+        if not name in config:
+            print(f"CTF {name} not found in config")
+            sys.exit(1)
+    glob = config["global"]
+    if args.record or args.replay:
+        # before any backend or sniffer builds its session
+        from . import fixtures
+        fixtures.use(args.record or args.replay, "record" if args.record else "replay")
+    ctfs = load_ctfs(config, args.names)
+    sniffers = load_sniffers(glob, ctfs)
+    for ctf in ctfs.values():
+        patterns = patterns_of(ctf.config)
+        plural = "s" if len(patterns) > 1 else ""
+        print(f"Sniffing for {ctf.name} with flag format{plural} " + ", ".join(f"r'{pattern}'" for pattern in patterns) + "...")
+        if glob['use_discord_webhook']:
+            formats = "\n".join(patterns)
+            discord_status_embed(f"starting up for ctf {ctf.name}, flag format{plural}: \n```\n{formats}\n```", glob['keys']['discord_webhook'])
+        # pick up flags found by versions that kept them in a text file
+        flag_store(glob).import_legacy(ctf.name, f"flags_found_{ctf.name}.txt")
+    resume_unreported(ctfs, glob)
+    exporters = metrics.start(glob)
     print("Press Ctrl+C to exit")
+    if args.profile:
+        with Sampler(glob.get("profile_interval", 0.005)) as sampler:
+            dispatch(sniffers, ctfs, glob)
+            if NOTIFIER is not None:
+                NOTIFIER.close()
+        sampler.report()
+        print()
+        metrics.METRICS.report()
+        if args.profile_out:
+            sampler.dump_collapsed(args.profile_out)
+        exporters.close()
+        sys.exit(0)
     if args.test:
-        dispatch(sniffers, backend, config.get("challenges"), glob, args.name)
+        dispatch(sniffers, ctfs, glob)
+        if NOTIFIER is not None:
+            NOTIFIER.close()
+        exporters.close()
         sys.exit(0)
-    schedule.every(glob["interval"]).seconds.do(dispatch, sniffers, backend, config.get("challenges"), glob, args.name)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    scheduler = Scheduler(sniffers, glob, lambda sniffer, flags: handle_flags(flags, ctfs, glob), drain_llm)
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        scheduler.run_forever()
     except KeyboardInterrupt:
         print("Bye!")
+        scheduler.close()
+        if LLM_QUEUE is not None:
+            LLM_QUEUE.close()
         if glob['use_discord_webhook']:
             discord_status_embed("shutting down.", glob['keys']['discord_webhook'])
-        with open(f"flags_found_{args.name}.txt", "w") as f:
-            for flag in FOUND_THIS_SESSION:
-                f.write(flag + "\n")
+        if NOTIFIER is not None:
+            NOTIFIER.close()
+        exporters.close()
+        scan.shutdown()
+        flag_store(glob).close()
     sys.exit(0)
     
 if __name__ == '__main__':
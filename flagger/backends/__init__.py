@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import List, Optional
+from ..registry import Registry
+
+CHALLENGES_TTL = 60
 
 class Backend(ABC):
     @abstractmethod
@@ -14,6 +17,16 @@ class Backend(ABC):
     def submit_flag(self, flag: str, challenge: str) -> bool:
         pass
 
-from .ctfd import CtfdBackend
-from .zeroctf import ZeroCtfBackend
-from .ctfx import CtfxBackend
\ No newline at end of file
+BACKENDS = Registry("flagger.backends", {
+    "ctfd": "flagger.backends.ctfd:CtfdBackend",
+    "0ctf": "flagger.backends.zeroctf:ZeroCtfBackend",
+    "ctfx": "flagger.backends.ctfx:CtfxBackend",
+})
+
+_LAZY = {"CtfdBackend": "ctfd", "ZeroCtfBackend": "0ctf", "CtfxBackend": "ctfx"}
+
+def __getattr__(name: str):
+    # backend modules pull in requests, only import them when asked for
+    if name in _LAZY:
+        return BACKENDS.load(_LAZY[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,53 +1,44 @@
-from . import Backend
+from . import Backend, CHALLENGES_TTL
+from .transport import Transport, ChallengeIndex
 from typing import Optional, List
 import requests
 
 class CtfdBackend(Backend):
-    def __init__(self, url: str, token: Optional[str] = None):
+    def __init__(self, url: str, token: Optional[str] = None, challenges_ttl: float = CHALLENGES_TTL):
         if not token:
             raise ValueError("CtfdBackend requires a token")
         self.url = url
         self.token = token
-        s = requests.Session()
-        s.headers.update({"Authorization": f"Token {token}"})
-        self.session = s
-        self.headers = {
+        self.transport = Transport(headers={
+            "Authorization": f"Token {token}",
             "Content-Type": "application/json",
-        }
+        })
+        self.index = ChallengeIndex(self.transport, self.url_for("challenges"), lambda res: [(c["name"], c["id"]) for c in res["data"]], challenges_ttl)
         self._test_connection()
         
     def url_for(self, path: str) -> str:
         return (self.url + path).strip("/")
         
     def _test_connection(self):
-        r = self.session.get(self.url_for("challenges"), headers=self.headers)
         try:
-            r.raise_for_status()
+            self.index.refresh(force=True)
         except requests.HTTPError as e:
             print(f"Error connecting to CTFd: {e}")
-            print(r.text)
+            print(e.response.text)
             raise
 
     def get_challenges(self) -> List[str]:
-        r = self.session.get(self.url_for("challenges"), headers=self.headers)
-        r.raise_for_status()
-        return [c["name"] for c in r.json()["data"]]
+        return self.index.names()
     
     def submit_flag(self, flag: str, challenge: str) -> bool:
-        r = self.session.get(self.url_for("challenges"), headers=self.headers)
-        r.raise_for_status()
-        challenge_id = None
-        for c in r.json()["data"]:
-            if c["name"] == challenge:
-                challenge_id = c["id"]
-                break
+        challenge_id = self.index.id_of(challenge)
         if not challenge_id:
             raise ValueError(f"Challenge {challenge} not found")
         data = {
             "challenge_id": challenge_id,
             "submission": flag
         }
-        r = self.session.post(self.url_for("challenges/attempt"), headers=self.headers, json=data)
+        r = self.transport.post(self.url_for("challenges/attempt"), json=data)
         r.raise_for_status()
         res = r.json()
         if res["success"]:
@@ -1,38 +1,30 @@
-from . import Backend
+from . import Backend, CHALLENGES_TTL
+from .transport import Transport, ChallengeIndex
 from typing import Optional, List
-import requests
-import json
 
 class CtfxBackend(Backend):
-    def __init__(self, url: str, username: str, password: str):
+    def __init__(self, url: str, username: str, password: str, challenges_ttl: float = CHALLENGES_TTL):
         self.url = url.rstrip('/') + '/api'
-        self.session = requests.Session()
+        self.transport = Transport()
 
         login_data = {
             'action': 'login',
             'email': username,
             'password': password
         }
-        r = self.session.post(self.url, data=login_data)
+        r = self.transport.post(self.url, data=login_data)
         if 'Wrong email or password' in r.text:
             raise ValueError("Invalid login credentials")
 
-        r = self.session.get(self.url + '?get=xsrf_token')
+        r = self.transport.get(self.url + '?get=xsrf_token')
         self.xsrf_token = r.text
+        self.index = ChallengeIndex(self.transport, self.url + '?get=challenges', lambda res: [(c['title'], c['id']) for c in res], challenges_ttl)
 
     def get_challenges(self) -> List[str]:
-        r = self.session.get(self.url + '?get=challenges')
-        challenges = json.loads(r.text)
-        return [c['title'] for c in challenges]
+        return self.index.names()
 
     def submit_flag(self, flag: str, challenge: str) -> bool:
-        r = self.session.get(self.url + '?get=challenges')
-        challenges = json.loads(r.text)
-        challenge_id = None
-        for c in challenges:
-            if c['title'] == challenge:
-                challenge_id = c['id']
-                break
+        challenge_id = self.index.id_of(challenge)
         
         if not challenge_id:
             raise ValueError(f"Challenge {challenge} not found")
@@ -43,5 +35,5 @@ class CtfxBackend(Backend):
             'flag': flag,
             'xsrf_token': self.xsrf_token
         }
-        r = self.session.post(self.url, data=submit_data)
-        return 'Challenge solved!' in r.text
\ No newline at end of file
+        r = self.transport.post(self.url, data=submit_data)
+        return 'Challenge solved!' in r.text
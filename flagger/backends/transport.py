@@ -0,0 +1,76 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import CHALLENGES_TTL
+from ..net import DEFAULT_TIMEOUT, mount
+
+class Transport:
+    """
+    Pooled session shared by a backend's requests, with default timeouts and
+    retries on connection errors and 429/5xx responses. Only idempotent
+    requests are retried, so a flag submission is never sent twice.
+    """
+    def __init__(self, headers: Optional[Dict[str, str]] = None, timeout=DEFAULT_TIMEOUT, retries: int = 3, pool_size: int = 4):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True)
+        mount(self.session, HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+        if headers:
+            self.session.headers.update(headers)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+class ChallengeIndex:
+    """
+    Name -> id index of a CTF's challenges, fetched at most once per `ttl`
+    seconds and revalidated with a conditional GET when the server supports
+    ETag or Last-Modified. `parse` turns the decoded JSON response into
+    (name, id) pairs.
+    """
+    def __init__(self, transport: Transport, url: str, parse: Callable[[Any], List[Tuple[str, Any]]], ttl: float = CHALLENGES_TTL):
+        self.transport = transport
+        self.url = url
+        self.parse = parse
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.ids: Dict[str, Any] = {}
+        self.fetched_at = 0.0
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+
+    def refresh(self, force: bool = False) -> None:
+        with self.lock:
+            if not force and self.fetched_at and time.time() - self.fetched_at < self.ttl:
+                return
+            headers = {}
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+            r = self.transport.get(self.url, headers=headers)
+            if r.status_code != 304:
+                r.raise_for_status()
+                self.ids = dict(self.parse(r.json()))
+                self.etag = r.headers.get("ETag")
+                self.last_modified = r.headers.get("Last-Modified")
+            self.fetched_at = time.time()
+
+    def names(self) -> List[str]:
+        self.refresh()
+        return list(self.ids)
+
+    def id_of(self, name: str) -> Optional[Any]:
+        self.refresh()
+        if name not in self.ids:
+            # might have been released since the last refresh
+            self.refresh(force=True)
+        return self.ids.get(name)
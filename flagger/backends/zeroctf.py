@@ -1,29 +1,29 @@
-from . import Backend
+from . import Backend, CHALLENGES_TTL
+from .transport import Transport, ChallengeIndex
 from typing import Optional, List
 import requests
 
 class ZeroCtfBackend(Backend):
-    def __init__(self, url: str, token: Optional[str] = None):
+    def __init__(self, url: str, token: Optional[str] = None, challenges_ttl: float = CHALLENGES_TTL):
         self.url = url
         self.scoreboard_url = url + "data/scoreboard_1.json"
+        self.transport = Transport()
+        # the scoreboard has no ids, nothing is submitted through it anyway
+        self.index = ChallengeIndex(self.transport, self.scoreboard_url, lambda res: [(c["title"], None) for c in res["problems"]], challenges_ttl)
         self._test_connection()
         
     def _test_connection(self):
-        r = requests.get(self.scoreboard_url)
         try:
-            r.raise_for_status()
+            self.index.refresh(force=True)
         except requests.HTTPError as e:
             print(f"Error connecting to ZeroCtf: {e}")
             raise
     
     def get_challenges(self) -> List[str]:
-        r = requests.get(self.scoreboard_url)
-        r.raise_for_status()
-        res = r.json()["problems"]
-        return [c["title"] for c in res]
+        return self.index.names()
     
     def submit_flag(self, flag, challenge) -> bool:
         """
         Not implemented.
         """
-        return True
\ No newline at end of file
+        return True
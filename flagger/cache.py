@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+import time
+import json
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = "fetch_cache.sqlite"
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+@dataclass
+class CacheEntry:
+    validator: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # (ctf, flag, context, format) extracted from the document last time it was scanned
+    matches: List[Tuple[str, ...]]
+
+class FetchCache:
+    """
+    On-disk cache of per-document scan results, keyed by URL + flag formats.
+    An entry is reused when the document's validator (a GitHub blob SHA, or an
+    ETag/Last-Modified pair confirmed by a 304) says it hasn't changed.
+    Least recently used entries are evicted once the cache outgrows `max_bytes`.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                validator TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                matches TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                atime REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+        self.db.commit()
+
+    @staticmethod
+    def key(url: str, pattern: str) -> str:
+        return hashlib.sha256(f"{pattern}\0{url}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self.lock:
+            row = self.db.execute("SELECT validator, etag, last_modified, matches FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        return CacheEntry(row[0], row[1], row[2], [tuple(m) for m in json.loads(row[3])])
+
+    def hit(self, key: str, validator: str) -> Optional[CacheEntry]:
+        """
+        Returns the cached entry for `key` only if its validator still matches.
+        """
+        entry = self.get(key)
+        if entry is None or entry.validator != validator:
+            return None
+        return entry
+
+    def put(self, key: str, matches: List[Tuple[str, ...]], validator: Optional[str] = None, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        if validator is None and etag is None and last_modified is None:
+            # nothing to revalidate against next time
+            return
+        data = json.dumps(matches)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, validator, etag, last_modified, data, len(data) + len(key), time.time())
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY atime").fetchall():
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+_CACHES: Dict[str, FetchCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+def open_cache(global_config: Dict[str, Any]) -> Optional[FetchCache]:
+    """
+    Returns the cache shared by every sniffer using this config, or None if
+    caching is turned off with `"cache": false`.
+    """
+    if not global_config.get("cache", True):
+        return None
+    path = global_config.get("cache_path", DEFAULT_CACHE_PATH)
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            _CACHES[path] = FetchCache(path, global_config.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES))
+        return _CACHES[path]
@@ -0,0 +1,101 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+FUZZ_THRESHOLD = 80
+
+class ChallengeAutomaton:
+    """
+    Aho-Corasick automaton over lowercased challenge names, counting how
+    often every name occurs in a text in a single pass over it.
+    """
+    def __init__(self, names: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # indices into `names` of every pattern ending at a state
+        self.out: List[List[int]] = [[]]
+        for i, name in enumerate(names):
+            if not name:
+                continue
+            state = 0
+            for ch in name:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(i)
+        # root children keep the default failure link to the root
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def count(self, text: str) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for i in out[state]:
+                counts[i] = counts.get(i, 0) + 1
+        return counts
+
+@dataclass
+class Classification:
+    # one entry per text occurrence of a challenge name, plus the first fuzzy match
+    matches: List[str] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+class Classifier:
+    """
+    Built once per cycle from the challenge list and used to classify every
+    flag found in that cycle in one batch.
+    """
+    def __init__(self, challenges: List[str], workers: int = 1):
+        self.challenges = challenges
+        self.automaton = ChallengeAutomaton([c.lower() for c in challenges])
+        self.workers = workers
+
+    def _fuzzy(self, contexts: List[str]) -> List[int]:
+        """
+        Index of the first challenge scoring above FUZZ_THRESHOLD against each context, or -1.
+        """
+        if not contexts or not self.challenges:
+            return [-1] * len(contexts)
+        # rapidfuzz is only imported once there's something to classify
+        from rapidfuzz import fuzz
+        try:
+            from rapidfuzz.process import cdist
+            scores = cdist(contexts, self.challenges, scorer=fuzz.ratio, score_cutoff=FUZZ_THRESHOLD, workers=self.workers)
+            rows = scores.tolist()
+        except ImportError:
+            # cdist needs numpy
+            rows = [[fuzz.ratio(context, challenge) for challenge in self.challenges] for context in contexts]
+        return [next((i for i, score in enumerate(row) if score > FUZZ_THRESHOLD), -1) for row in rows]
+
+    def classify(self, contexts: List[str]) -> List[Classification]:
+        results = []
+        for context, fuzzy in zip(contexts, self._fuzzy(contexts)):
+            counts = self.automaton.count(context.lower())
+            res = Classification()
+            for i, challenge in enumerate(self.challenges):
+                n = counts.get(i, 0)
+                if n:
+                    res.counts[challenge] = n
+                    res.matches += [challenge] * n
+            if fuzzy != -1:
+                res.matches.append(self.challenges[fuzzy])
+            results.append(res)
+        return results
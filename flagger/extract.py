@@ -0,0 +1,276 @@
+import re
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # before 3.11
+    import sre_parse
+
+CONTEXT_LINES = 50
+
+class Document:
+    """
+    Wraps a document's text with a lazily built index of line start offsets,
+    so the line of any match can be found by bisection and a context window
+    sliced out without splitting the whole document.
+    """
+    __slots__ = ("text", "_offsets")
+
+    def __init__(self, text: str):
+        self.text = text
+        self._offsets: Optional[List[int]] = None
+
+    @property
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            offsets = [0]
+            find = self.text.find
+            i = find("\n")
+            while i != -1:
+                offsets.append(i + 1)
+                i = find("\n", i + 1)
+            self._offsets = offsets
+        return self._offsets
+
+    def line_of(self, pos: int) -> int:
+        return bisect_right(self.offsets, pos) - 1
+
+    def span(self, start: int, end: int) -> str:
+        """
+        Lines [start, end) exactly as they are in the text, newlines included.
+        """
+        offsets = self.offsets
+        stop = offsets[end] if end < len(offsets) else len(self.text)
+        return self.text[offsets[start]:stop]
+
+    def lines(self, start: int, end: int) -> str:
+        """
+        Lines [start, end) as one string, without the trailing newline.
+        """
+        return self.span(start, end).rstrip("\r\n")
+
+    def context(self, line: int, radius: int = CONTEXT_LINES) -> "ContextRef":
+        return ContextRef(self, max(0, line - radius), min(len(self.offsets), line + radius))
+
+class ContextRef:
+    """
+    Lines [start, end) of a document, referenced instead of copied. The
+    document is only the window of lines around a match (see
+    `Extractor.matches`), shared by every flag whose context falls in it; the
+    text is only sliced out when something reads it.
+    """
+    __slots__ = ("doc", "start", "end", "_key")
+
+    def __init__(self, doc: Document, start: int, end: int):
+        self.doc = doc
+        self.start = start
+        self.end = end
+        self._key: Optional[int] = None
+
+    @classmethod
+    def of(cls, text: str) -> "ContextRef":
+        """
+        Wraps an already extracted context, e.g. one read back from the cache.
+        """
+        return cls(Document(text), 0, text.count("\n") + 1)
+
+    def text(self) -> str:
+        return self.doc.lines(self.start, self.end)
+
+    @property
+    def key(self) -> int:
+        """
+        Hash of the text, so the same context found on mirrors is only kept once.
+        """
+        if self._key is None:
+            self._key = hash(self.text())
+        return self._key
+
+# zero-width items a literal prefix can look past
+_ZERO_WIDTH = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+# stop expanding alternations into prefixes past this many
+_MAX_PREFIXES = 64
+
+def _prefixes_of(items) -> Tuple[List[str], bool]:
+    """
+    Literal strings every match of the parsed `items` starts with one of,
+    and whether they make up the whole of it.
+    """
+    prefixes = [""]
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            prefixes = [prefix + chr(av) for prefix in prefixes]
+            continue
+        if op in _ZERO_WIDTH:
+            continue
+        if op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+            inner, complete = _prefixes_of(av[3])
+        elif op is sre_parse.BRANCH:
+            branches = [_prefixes_of(branch) for branch in av[1]]
+            inner = [prefix for branch, _ in branches for prefix in branch]
+            complete = all(complete for _, complete in branches)
+        else:
+            return prefixes, False
+        if len(prefixes) * len(inner) > _MAX_PREFIXES:
+            return prefixes, False
+        prefixes = [prefix + rest for prefix in prefixes for rest in inner]
+        if not complete:
+            return prefixes, False
+    return prefixes, True
+
+def literal_prefixes(pattern: str) -> Optional[List[str]]:
+    """
+    Literal prefixes every match of `pattern` starts with one of, e.g.
+    ["ctf{", "flag{"] for (?:flag|ctf)\\{.*?\\}, or None if some match could
+    start with anything (a leading class or repeat, case-insensitive matching).
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    prefixes, _ = _prefixes_of(parsed)
+    if not all(prefixes):
+        return None
+    return sorted(set(prefixes))
+
+def _common_suffix(strings: List[str]) -> str:
+    n = 0
+    while all(len(s) > n for s in strings) and len({s[-1 - n] for s in strings}) == 1:
+        n += 1
+    return strings[0][len(strings[0]) - n:]
+
+class Extractor:
+    """
+    Scans documents for several flag formats at once. `formats` is a list of
+    (label, pattern) pairs, usually one per CTF and flag format; every label
+    sharing a pattern gets its own match, and every match reports the pattern
+    it came from. Like `re.findall`, a pattern with exactly one group reports
+    that group.
+
+    Patterns whose matches all start with a literal prefix (most flag
+    formats: "flag{", "CTF{", ...) aren't run over the whole document.
+    Occurrences of the prefixes are found with str.find, looking for the
+    suffix prefixes share (usually "{") so more formats don't mean more
+    passes, and each pattern is only tried where one of its prefixes is.
+    The rest are each scanned with their own finditer: an alternation of
+    them would miss one format's match overlapping another's.
+    """
+    def __init__(self, formats: Union[str, List[Tuple[str, str]]], context_lines: int = CONTEXT_LINES):
+        if isinstance(formats, str):
+            formats = [("", formats)]
+        self.context_lines = context_lines
+        # pattern -> labels using it
+        patterns: Dict[str, List[str]] = {}
+        for label, pattern in formats:
+            patterns.setdefault(pattern, []).append(label)
+        self.patterns = list(patterns.items())
+        # prefix -> (index, compiled pattern, group reporting the flag, labels, pattern) starting with it
+        self.prefixed: Dict[str, List[Tuple[int, re.Pattern, int, List[str], str]]] = {}
+        # shared suffix of a set of prefixes -> lengths of those prefixes
+        self.anchors: Dict[str, List[int]] = {}
+        # scanned over the whole text: (compiled pattern, group reporting the flag, labels, pattern)
+        self.separate: List[Tuple[re.Pattern, int, List[str], str]] = []
+        for index, (pattern, labels) in enumerate(self.patterns):
+            regex = re.compile(pattern)
+            group = 1 if regex.groups == 1 else 0
+            prefixes = literal_prefixes(pattern)
+            if prefixes is not None:
+                for prefix in prefixes:
+                    self.prefixed.setdefault(prefix, []).append((index, regex, group, labels, pattern))
+            else:
+                self.separate.append((regex, group, labels, pattern))
+        # one find() pass per distinct last character, over the suffix the prefixes ending in it share
+        by_last: Dict[str, List[str]] = {}
+        for prefix in self.prefixed:
+            by_last.setdefault(prefix[-1], []).append(prefix)
+        for group in by_last.values():
+            self.anchors[_common_suffix(group)] = sorted({len(prefix) for prefix in group})
+
+    @property
+    def prefixes(self) -> Optional[List[str]]:
+        """
+        Literal strings every match starts with one of, or None if some
+        format's matches don't all start with a literal.
+        """
+        if self.separate:
+            return None
+        return list(self.prefixed)
+
+    def _prefix_hits(self, text: str) -> List[Tuple[int, str]]:
+        """
+        (start, prefix) of every occurrence of a literal prefix, in order.
+        """
+        hits = []
+        find = text.find
+        prefixed = self.prefixed
+        for anchor, lengths in self.anchors.items():
+            i = find(anchor)
+            while i != -1:
+                end = i + len(anchor)
+                for n in lengths:
+                    if end >= n and text[end - n:end] in prefixed:
+                        hits.append((end - n, text[end - n:end]))
+                i = find(anchor, i + 1)
+        hits.sort()
+        return hits
+
+    def _matches(self, text: str) -> Iterator[Tuple[List[str], str, str, int]]:
+        for regex, group, labels, pattern in self.separate:
+            for match in regex.finditer(text):
+                yield labels, pattern, match.group(group), match.start(group)
+        if self.prefixed:
+            # like finditer, a pattern's matches don't overlap
+            ends: Dict[int, int] = {}
+            for start, prefix in self._prefix_hits(text):
+                for index, regex, group, labels, pattern in self.prefixed[prefix]:
+                    if start < ends.get(index, 0):
+                        continue
+                    match = regex.match(text, start)
+                    if match:
+                        ends[index] = max(match.end(), start + 1)
+                        yield labels, pattern, match.group(group), match.start(group)
+
+    def search(self, text: str) -> bool:
+        """
+        Whether any format matches anywhere in `text`, without building contexts.
+        """
+        for start, prefix in self._prefix_hits(text):
+            if any(regex.match(text, start) for _, regex, _, _, _ in self.prefixed[prefix]):
+                return True
+        return any(regex.search(text) for regex, _, _, _ in self.separate)
+
+    def matches(self, text: str) -> Iterator[Tuple[str, str, str, ContextRef]]:
+        """
+        Yields a (label, pattern, flag, context) tuple for every match in `text`.
+        Overlapping contexts are merged into windows that are copied out of
+        `text`, so the flags found don't keep the whole document alive.
+        """
+        doc = Document(text)
+        found = []
+        for labels, pattern, flag, pos in self._matches(text):
+            if flag:
+                context = doc.context(doc.line_of(pos), self.context_lines)
+                found.append((labels, pattern, flag, context.start, context.end))
+        spans: List[List[int]] = []
+        for start, end in sorted({(start, end) for *_, start, end in found}):
+            if spans and start < spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        windows = [Document(doc.span(start, end)) for start, end in spans]
+        firsts = [start for start, _ in spans]
+        for labels, pattern, flag, start, end in found:
+            i = bisect_right(firsts, start) - 1
+            context = ContextRef(windows[i], start - firsts[i], end - firsts[i])
+            for label in labels:
+                yield label, pattern, flag, context
+
+    def extract(self, text: str) -> Iterator[Tuple[str, str, ContextRef]]:
+        """
+        Yields a (label, flag, context) triple for every match in `text`.
+        """
+        for label, _, flag, context in self.matches(text):
+            yield label, flag, context
@@ -0,0 +1,268 @@
+"""
+Index of documents already scanned, shared by every sniffer, so the same
+writeup turning up as a GitHub hit, its forks and a handful of web mirrors
+is only parsed and scanned once. Documents are fingerprinted by
+
+    blob:<sha>      the GitHub blob SHA from a code search hit, before fetching
+    url:<url>       the normalized URL of a web result, before fetching
+    sha256:<hex>    the fetched bytes
+    a simhash       of the page's words, for mirrors with different markup
+
+and what the scan found is stored under every fingerprint, per set of flag
+formats. Blob SHAs and content hashes are kept across cycles on disk; a URL
+may serve something else later, so it's only trusted for `dedupe_url_ttl`
+seconds and revalidation is otherwise left to the fetch cache.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_INDEX_PATH = "fingerprints.sqlite"
+DEFAULT_INDEX_MAX_ENTRIES = 200_000
+# about a cycle, after that a page is revalidated through the fetch cache again
+DEFAULT_URL_TTL = 60
+# simhashes this many bits apart or fewer count as the same page
+DEFAULT_SIMHASH_DISTANCE = 3
+# how long to wait on another thread scanning the same document
+CLAIM_TIMEOUT = 60
+
+# (ctf, flag, context, format), same as FetchCache entries
+Match = Tuple[str, ...]
+
+# tracking parameters mirrors and search engines tack on
+_TRACKING = re.compile(r"^(utm_\w+|fbclid|gclid|ref|ref_src|source)$", re.I)
+
+def normalize_url(url: str) -> str:
+    """
+    Drops what doesn't change the page: scheme, www., default ports, the
+    fragment, tracking parameters, parameter order and a trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host += f":{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING.match(k)))
+    return urlunsplit(("", host, path, query, ""))[2:]
+
+_TAGS = re.compile(rb"<[^>]*>")
+_WORDS = re.compile(rb"\w{2,}")
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BIT_SET = [bytes(value >> bit & 1 for value in range(256)) for bit in range(8)]
+
+def simhash(body: bytes) -> int:
+    """
+    64-bit simhash over the distinct word pairs of a page, markup stripped.
+    """
+    words = _WORDS.findall(_TAGS.sub(b" ", body).lower())
+    if len(words) < 2:
+        return 0
+    hashes = b"".join(hashlib.blake2b(a + b" " + b, digest_size=8).digest() for a, b in set(zip(words, words[1:])))
+    n = len(hashes) // 8
+    total = 0
+    for column in range(8):
+        values = hashes[column::8]
+        for bit in range(8):
+            # bytes with this bit set become 1, counted in C
+            if values.translate(_BIT_SET[bit]).count(1) * 2 > n:
+                total |= 1 << ((7 - column) * 8 + bit)
+    return total
+
+# what an HTML parser would take for markup: tags, end tags, comments, declarations
+_MARKUP = re.compile(rb"<[a-zA-Z/!?][^>]*>")
+_CDATA = re.compile(rb"<!\[CDATA\[(.*?)\]\]>", re.S)
+# flags longer than this aren't told apart by their windows
+FLAG_WINDOW = 512
+
+def flag_windows(body: bytes, prefixes: List[bytes]) -> str:
+    """
+    Digest of the FLAG_WINDOW bytes after every occurrence of a flag prefix
+    in the page with its markup stripped (CDATA sections kept), so a flag
+    body split up by tags is still part of its window. Anything a text
+    extractor keeps survives the stripping, so a near-duplicate with the
+    same windows can't hold a flag of up to FLAG_WINDOW bytes the original
+    didn't.
+    """
+    text = _MARKUP.sub(b"", _CDATA.sub(rb"\1", body))
+    windows = []
+    for prefix in prefixes:
+        i = text.find(prefix)
+        while i != -1:
+            windows.append(text[i:i + FLAG_WINDOW])
+            i = text.find(prefix, i + 1)
+    return hashlib.sha256(b"\0".join(sorted(windows))).hexdigest()
+
+class FingerprintIndex:
+    """
+    `claim` returns what an earlier scan found for any of a document's
+    fingerprints, or reserves them for the caller, who then `record`s what
+    it found or `release`s them. A thread claiming a fingerprint another
+    thread is working on waits for that result, so forks fetched in
+    parallel are still only scanned once.
+    """
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, max_entries: int = DEFAULT_INDEX_MAX_ENTRIES, url_ttl: float = DEFAULT_URL_TTL, distance: int = DEFAULT_SIMHASH_DISTANCE):
+        self.max_entries = max_entries
+        self.url_ttl = url_ttl
+        self.distance = distance
+        self.lock = threading.Lock()
+        # key -> (expiry, matches), for fingerprints that can go stale
+        self.recent: Dict[str, Tuple[float, List[Match]]] = {}
+        # key -> set once whoever claimed it is done
+        self.pending: Dict[str, threading.Event] = {}
+        self.puts = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY,
+                matches TEXT NOT NULL,
+                atime REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS near (
+                band TEXT NOT NULL,
+                simhash INTEGER NOT NULL,
+                matches TEXT NOT NULL,
+                atime REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS documents_atime ON documents (atime)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS near_band ON near (band)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS near_atime ON near (atime)")
+        self.db.commit()
+
+    @staticmethod
+    def key(scope: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{scope}\0{fingerprint}".encode()).hexdigest()
+
+    @staticmethod
+    def _volatile(fingerprint: str) -> bool:
+        return fingerprint.startswith("url:")
+
+    def _lookup(self, scope: str, fingerprints: Iterable[str]) -> Optional[Tuple[str, List[Match]]]:
+        now = time.time()
+        for fingerprint in fingerprints:
+            key = self.key(scope, fingerprint)
+            if self._volatile(fingerprint):
+                entry = self.recent.get(key)
+                if entry is not None and entry[0] > now:
+                    return fingerprint, entry[1]
+                continue
+            row = self.db.execute("SELECT matches FROM documents WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE documents SET atime = ? WHERE key = ?", (now, key))
+                self.db.commit()
+                return fingerprint, [tuple(m) for m in json.loads(row[0])]
+        return None
+
+    def claim(self, scope: str, fingerprints: List[str]) -> Optional[Tuple[str, List[Match]]]:
+        """
+        (fingerprint that hit, matches) if the document was already scanned,
+        otherwise None with `fingerprints` reserved for the caller.
+        """
+        keys = [self.key(scope, fingerprint) for fingerprint in fingerprints]
+        deadline = time.time() + CLAIM_TIMEOUT
+        while True:
+            with self.lock:
+                hit = self._lookup(scope, fingerprints)
+                if hit is not None:
+                    return hit
+                busy = next((self.pending[key] for key in keys if key in self.pending), None)
+                if busy is None:
+                    for key in keys:
+                        self.pending[key] = threading.Event()
+                    return None
+            # whoever has it may give up without a result, then it's ours
+            if not busy.wait(max(0, deadline - time.time())):
+                return None
+
+    def release(self, scope: str, fingerprints: Iterable[str]) -> None:
+        with self.lock:
+            for fingerprint in fingerprints:
+                event = self.pending.pop(self.key(scope, fingerprint), None)
+                if event is not None:
+                    event.set()
+
+    def record(self, scope: str, fingerprints: Iterable[str], matches: List[Match]) -> None:
+        """
+        Stores `matches` under every fingerprint and releases them.
+        """
+        fingerprints = list(fingerprints)
+        data = json.dumps(matches)
+        now = time.time()
+        with self.lock:
+            for fingerprint in fingerprints:
+                key = self.key(scope, fingerprint)
+                if self._volatile(fingerprint):
+                    self.recent[key] = (now + self.url_ttl, matches)
+                else:
+                    self.db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (key, data, now))
+            self._evict(now)
+            self.db.commit()
+        self.release(scope, fingerprints)
+
+    def _bands(self, scope: str, windows: str, value: int) -> List[str]:
+        # two simhashes within `distance` bits agree on at least one band
+        mask = (1 << _BAND_BITS) - 1
+        return [self.key(scope, f"near:{windows}:{i}:{value >> (i * _BAND_BITS) & mask}") for i in range(_BANDS)]
+
+    def near(self, scope: str, windows: str, value: int) -> Optional[List[Match]]:
+        """
+        Matches of a page whose simhash is within `distance` bits of `value`
+        and whose flag windows are identical.
+        """
+        bands = self._bands(scope, windows, value)
+        with self.lock:
+            rows = self.db.execute(f"SELECT simhash, matches FROM near WHERE band IN ({', '.join('?' * len(bands))})", bands).fetchall()
+        for other, matches in rows:
+            if ((other & 0xFFFFFFFFFFFFFFFF) ^ value).bit_count() <= self.distance:
+                return [tuple(m) for m in json.loads(matches)]
+        return None
+
+    def record_near(self, scope: str, windows: str, value: int, matches: List[Match]) -> None:
+        data = json.dumps(matches)
+        now = time.time()
+        # sqlite integers are signed
+        signed = value - (1 << 64) if value >= 1 << 63 else value
+        with self.lock:
+            self.db.executemany("INSERT INTO near VALUES (?, ?, ?, ?)", [(band, signed, data, now) for band in self._bands(scope, windows, value)])
+            self.db.commit()
+
+    def _evict(self, now: float) -> None:
+        self.puts += 1
+        if self.puts % 256:
+            return
+        self.recent = {key: entry for key, entry in self.recent.items() if entry[0] > now}
+        for table in ("documents", "near"):
+            count = self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if count > self.max_entries:
+                self.db.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY atime LIMIT ?)", (count - self.max_entries,))
+
+_INDEXES: Dict[str, FingerprintIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+def open_index(global_config: Dict[str, Any]) -> Optional[FingerprintIndex]:
+    """
+    Returns the index shared by every sniffer using this config, or None if
+    deduplication is turned off with `"dedupe": false`.
+    """
+    if not global_config.get("dedupe", True):
+        return None
+    path = global_config.get("dedupe_path", DEFAULT_INDEX_PATH)
+    with _INDEXES_LOCK:
+        if path not in _INDEXES:
+            _INDEXES[path] = FingerprintIndex(
+                path,
+                global_config.get("dedupe_max_entries", DEFAULT_INDEX_MAX_ENTRIES),
+                global_config.get("dedupe_url_ttl", DEFAULT_URL_TTL),
+                global_config.get("simhash_distance", DEFAULT_SIMHASH_DISTANCE),
+            )
+        return _INDEXES[path]
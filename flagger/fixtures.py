@@ -0,0 +1,188 @@
+"""
+Record/replay of the HTTP exchanges flagger makes, so a cycle can be rerun
+offline. While recording, every session mounted through `net.mount` saves
+the responses it gets to a fixture directory; while replaying, those
+sessions answer from the directory and never touch the network. Search
+results that don't go through requests (DuckDuckGo) are kept the same way
+by `recorded`.
+
+Ollama isn't covered, replay with use_llm off.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+EXCHANGES = "exchanges.jsonl"
+SEARCHES = "searches.jsonl"
+
+# bodies are stored decoded, so these no longer describe them
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+class Fixtures:
+    """
+    A fixture directory: `exchanges.jsonl` lists the responses by request,
+    `bodies/` holds the response bodies by sha256 and `searches.jsonl` the
+    recorded search results. Requests are matched on method and URL (query
+    parameters in any order); a request made several times gets the recorded
+    responses in order, then the last one again.
+    """
+    def __init__(self, path: str, mode: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"unknown fixture mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.exchanges: Dict[str, List[Dict[str, Any]]] = {}
+        self.searches: Dict[Tuple[str, str], List[Any]] = {}
+        self.served: Dict[str, int] = {}
+        self.bodies: Dict[str, bytes] = {}
+        if mode == "record":
+            os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        exchanges = os.path.join(self.path, EXCHANGES)
+        if os.path.exists(exchanges):
+            with open(exchanges, "r") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.exchanges.setdefault(record["key"], []).append(record)
+        searches = os.path.join(self.path, SEARCHES)
+        if os.path.exists(searches):
+            with open(searches, "r") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.searches[(record["kind"], record["query"])] = record["results"]
+
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return f"{method.upper()} {urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ''))}"
+
+    def record(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        headers = {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS}
+        line = json.dumps({"key": self.key(method, url), "url": url, "status": status, "headers": headers, "body": digest})
+        with self.lock:
+            body_path = os.path.join(self.path, "bodies", digest)
+            if not os.path.exists(body_path):
+                with open(body_path, "wb") as f:
+                    f.write(body)
+            with open(os.path.join(self.path, EXCHANGES), "a") as f:
+                f.write(line + "\n")
+
+    def record_search(self, kind: str, query: str, results: List[Any]) -> None:
+        line = json.dumps({"kind": kind, "query": query, "results": results})
+        with self.lock:
+            with open(os.path.join(self.path, SEARCHES), "a") as f:
+                f.write(line + "\n")
+
+    def replay(self, method: str, url: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        key = self.key(method, url)
+        with self.lock:
+            records = self.exchanges.get(key)
+            if not records:
+                return None
+            i = self.served.get(key, 0)
+            self.served[key] = i + 1
+            record = records[min(i, len(records) - 1)]
+            body = self.bodies.get(record["body"])
+            if body is None:
+                # kept in memory so replays measure flagger, not the disk
+                with open(os.path.join(self.path, "bodies", record["body"]), "rb") as f:
+                    body = self.bodies[record["body"]] = f.read()
+        return record, body
+
+    def search(self, kind: str, query: str, fn: Callable[[], List[Any]]) -> List[Any]:
+        if self.mode == "record":
+            results = fn()
+            self.record_search(kind, query, results)
+            return results
+        results = self.searches.get((kind, query))
+        if results is None:
+            raise requests.ConnectionError(f"no recorded {kind} results for {query!r}")
+        return results
+
+class RecordingAdapter(BaseAdapter):
+    def __init__(self, fixtures: Fixtures, adapter: BaseAdapter):
+        super().__init__()
+        self.fixtures = fixtures
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        # 304s are answered from the recorded 200 on replay
+        if response.status_code != 304:
+            # reads the whole body, even for streamed requests; later reads are served from it
+            self.fixtures.record(request.method, request.url, response.status_code, dict(response.headers), response.content)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, fixtures: Fixtures):
+        super().__init__()
+        self.fixtures = fixtures
+
+    def send(self, request, **kwargs):
+        found = self.fixtures.replay(request.method, request.url)
+        if found is None:
+            raise requests.ConnectionError(f"no recorded response for {request.method} {request.url}", request=request)
+        record, body = found
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = record["status"]
+        response.headers = CaseInsensitiveDict(record["headers"])
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if (etag and request.headers.get("If-None-Match") == etag) or (last_modified and request.headers.get("If-Modified-Since") == last_modified):
+            response.status_code = 304
+            body = b""
+        response.reason = HTTPStatus(response.status_code).phrase
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        return response
+
+    def close(self):
+        pass
+
+_ACTIVE: Optional[Fixtures] = None
+
+def use(path: str, mode: str) -> Fixtures:
+    """
+    Records to or replays from `path` in every session mounted from now on.
+    """
+    global _ACTIVE
+    _ACTIVE = Fixtures(path, mode)
+    return _ACTIVE
+
+def stop() -> None:
+    global _ACTIVE
+    _ACTIVE = None
+
+def wrap(adapter: BaseAdapter) -> BaseAdapter:
+    if _ACTIVE is None:
+        return adapter
+    if _ACTIVE.mode == "record":
+        return RecordingAdapter(_ACTIVE, adapter)
+    return ReplayAdapter(_ACTIVE)
+
+def recorded(kind: str, query: str, fn: Callable[[], List[Any]]) -> List[Any]:
+    """
+    `fn()`, recorded or replayed under (kind, query) when fixtures are in use.
+    """
+    if _ACTIVE is None:
+        return fn()
+    return _ACTIVE.search(kind, query, fn)
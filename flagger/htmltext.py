@@ -0,0 +1,179 @@
+"""
+HTML to text for pages scanned for flags. Every extractor returns what
+BeautifulSoup's get_text() does: the page's text nodes in document order,
+without comments or the contents of script, style and template elements,
+and with whitespace-only text outside pre/textarea collapsed to a single
+newline or space.
+
+    lxml    libxml2's parser, by far the fastest; used when lxml is installed.
+            Pages it reads differently (CDATA sections, content after
+            </html>) are handed to stream instead. libxml2 repairs broken
+            markup its own way, so on malformed pages (stray tags or text
+            around the root element) whitespace, and with it the lines
+            contexts are cut at, can still come out differently
+    stream  a streaming html.parser tokenizer, no tree is built
+    bs4     BeautifulSoup with html.parser, the old path
+"""
+import re
+from html.parser import HTMLParser
+from importlib.util import find_spec
+from typing import Callable, List
+
+HtmlToText = Callable[[str], str]
+
+# same elements BeautifulSoup leaves out of get_text()
+SKIPPED_TAGS = ("script", "style", "template")
+# and the ones it keeps whitespace in as is
+PRESERVE_TAGS = ("pre", "textarea")
+
+_ASCII_SPACES = " \n\t\f\r"
+
+def _collapse(data: str) -> str:
+    if data.strip(_ASCII_SPACES):
+        return data
+    return "\n" if "\n" in data else " "
+
+class _TextParser(HTMLParser):
+    """
+    Text is buffered until the next tag, comment or declaration, so it's
+    split into the same strings BeautifulSoup would make.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.pending: List[str] = []
+        # depth of skipped/preserving elements we're inside of
+        self.skipping = 0
+        self.preserving = 0
+
+    def _flush(self):
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if not self.skipping:
+            self.parts.append(data if self.preserving else _collapse(data))
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in PRESERVE_TAGS:
+            self.preserving += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in SKIPPED_TAGS and self.skipping:
+            self.skipping -= 1
+        elif tag in PRESERVE_TAGS and self.preserving:
+            self.preserving -= 1
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        # BeautifulSoup keeps CDATA sections as text, in any case
+        if data[:6].upper() == "CDATA[" and not self.skipping:
+            self.parts.append(data[len("CDATA["):])
+
+def stream_text(html: str) -> str:
+    parser = _TextParser()
+    parser.feed(html)
+    parser.close()
+    parser._flush()
+    return "".join(parser.parts)
+
+# doctype, comments and processing instructions ahead of the root element
+_PROLOGUE = re.compile(r"(\s*)(?:<!--.*?-->|<![^>]*>|<\?[^>]*>)", re.S)
+_WHITESPACE = re.compile(r"\s*")
+# libxml2 drops CDATA sections in HTML and runs anything after </html> into the body
+_CDATA = re.compile(r"<!\[cdata\[", re.I)
+_END = re.compile(r"</html\s*>", re.I)
+# html.parser reads their content as raw text, so a CDATA section in them is just text
+_RAW_TEXT = ("script", "style")
+
+def _lxml_differs(html: str) -> bool:
+    lower = None
+    for cdata in _CDATA.finditer(html):
+        # old XHTML-style pages wrap every inline script in one, those are dropped either way
+        lower = lower or html.lower()
+        i = cdata.start()
+        if not any(lower.rfind(f"<{tag}", 0, i) > lower.rfind(f"</{tag}", 0, i) for tag in _RAW_TEXT):
+            return True
+    end = _END.search(html)
+    return end is not None and bool(html[end.end():].strip())
+
+def _outside_root(html: str):
+    """
+    Whitespace before and after the root element, which libxml2 has nowhere
+    to put but BeautifulSoup keeps as text.
+    """
+    lead = []
+    pos = 0
+    while (m := _PROLOGUE.match(html, pos)):
+        lead.append(m.group(1))
+        pos = m.end()
+    lead.append(_WHITESPACE.match(html, pos).group())
+    # only called without anything but whitespace after </html>, see _lxml_differs
+    end = _END.search(html)
+    trail = html[end.end():] if end is not None else ""
+    return "".join(_collapse(ws) for ws in lead if ws), _collapse(trail) if trail else ""
+
+def _preserved(text) -> bool:
+    # a tail is outside the element it follows, text is inside its parent
+    elem = text.getparent()
+    if text.is_tail:
+        elem = elem.getparent()
+    while elem is not None:
+        if elem.tag in PRESERVE_TAGS:
+            return True
+        elem = elem.getparent()
+    return False
+
+def lxml_text(html: str) -> str:
+    from lxml import etree
+    from lxml.html import document_fromstring
+    if _lxml_differs(html):
+        return stream_text(html)
+    try:
+        tree = document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        # empty documents, or an XML encoding declaration in an already decoded page
+        return stream_text(html)
+    etree.strip_elements(tree, *SKIPPED_TAGS, with_tail=False)
+    lead, trail = _outside_root(html)
+    if tree.xpath("boolean(//pre|//textarea)"):
+        texts = [text if text.strip(_ASCII_SPACES) or _preserved(text) else _collapse(text) for text in tree.xpath("//text()")]
+    else:
+        texts = [_collapse(text) for text in tree.xpath("//text()")]
+    return lead + "".join(texts) + trail
+
+def bs4_text(html: str) -> str:
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser").get_text()
+
+EXTRACTORS = {
+    "lxml": lxml_text,
+    "stream": stream_text,
+    "bs4": bs4_text,
+}
+
+def get_extractor(name: str = "auto") -> HtmlToText:
+    """
+    The extractor called `name`, "auto" picking lxml when it's installed.
+    """
+    if name == "auto":
+        name = "lxml" if find_spec("lxml") is not None else "stream"
+    if name not in EXTRACTORS:
+        raise KeyError(f"Unknown html_extractor {name!r}, expected one of: auto, {', '.join(EXTRACTORS)}")
+    return EXTRACTORS[name]
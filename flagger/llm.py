@@ -0,0 +1,151 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from dataclasses import dataclass
+from textwrap import dedent
+from typing import Any, Callable, Dict, List, Optional
+from ollama import Client, ChatResponse
+from .sniffers import Flag
+from . import metrics
+
+# called with (flag, challenge or None, late); late results arrive after the
+# flag was already reported as an unknown challenge
+ResultCallback = Callable[[Flag, Optional[str], bool], None]
+
+def build_prompt(flag: Flag, challenges: List[str]) -> str:
+    return dedent(f"""Here is a flag and its context:
+
+                        ```plaintext
+                        Flag: {flag.flag}
+                        Origin: {flag.origin}
+                        Context: 
+                        {flag.context}
+                        ```
+
+                        Here is a list of challenges:
+                        ```plaintext
+                        {", ".join(challenges)}
+                        ```
+
+                        Out of the list of challenges, provide ONE challenge that you think this flag belongs to. Respond ONLY with the challenge name in a code block, do not include any other information. Eg:
+
+                        ```
+                        {challenges[0]}
+                        ```
+
+                        or
+
+                        ```
+                        {challenges[1]}
+                        ```
+
+                        etc...
+
+                        If it does not seem to match, respond with "FALSE POSITIVE" in a code block instead.
+                        """)
+
+@dataclass
+class PendingFlag:
+    flag: Flag
+    challenges: List[str]
+    key: str
+    on_result: ResultCallback
+    future: Future
+    deadline: float
+    attempts: int = 1
+    timed_out: bool = False
+
+class LlmQueue:
+    """
+    Classifies ambiguous flags on a small pool of workers talking to the local
+    Ollama server, so slow responses don't stall discovery. Flags that aren't
+    classified within `llm_timeout` are reported as unknown and reported again
+    once the model answers. Answers are memoized by (flag, context, challenges).
+    """
+    def __init__(self, global_config: Dict[str, Any]):
+        self.model = global_config.get("llm_model", "dolphin-mistral")
+        self.timeout = global_config.get("llm_timeout", 30)
+        self.max_attempts = global_config.get("llm_max_attempts", 3)
+        self.client = Client(host=global_config.get("ollama_host"), timeout=global_config.get("llm_request_timeout", 120))
+        self.pool = ThreadPoolExecutor(max_workers=global_config.get("llm_workers", 1), thread_name_prefix="llm")
+        self.memo: Dict[str, Optional[str]] = {}
+        self.pending: List[PendingFlag] = []
+
+    @staticmethod
+    def key(flag: Flag, challenges: List[str]) -> str:
+        h = hashlib.sha256()
+        for part in (flag.flag, flag.context, *challenges):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _classify(self, flag: Flag, challenges: List[str]) -> Optional[str]:
+        for _ in range(2): # 2 attempts to get a valid result
+            with metrics.timer("flagger_stage_seconds", stage="llm"):
+                response: ChatResponse = self.client.chat(model=self.model, messages=[
+                    {
+                        'role': 'system',
+                        'content': 'You are a helpful assistant chatbot for CTF competitions.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': build_prompt(flag, challenges)
+                    },
+                ])
+            msg = response.message.content
+            for challenge in challenges:
+                if challenge.lower() in msg.lower():
+                    return challenge
+            if "FALSE POSITIVE" in msg:
+                return None
+        return None
+
+    def submit(self, flag: Flag, challenges: List[str], on_result: ResultCallback) -> None:
+        key = self.key(flag, challenges)
+        if key in self.memo:
+            on_result(flag, self.memo[key], False)
+            return
+        print(" Falling back to LLM to classify...")
+        future = self.pool.submit(self._classify, flag, challenges)
+        self.pending.append(PendingFlag(flag, challenges, key, on_result, future, time.time() + self.timeout))
+
+    def drain(self, block: bool = True) -> None:
+        """
+        Hands finished classifications to their callbacks and reports flags
+        past their deadline as unknown. With `block`, first waits for
+        outstanding flags until their deadline.
+        """
+        waiting = [p.future for p in self.pending if not p.timed_out]
+        if block and waiting:
+            deadline = max(p.deadline for p in self.pending if not p.timed_out)
+            wait(waiting, timeout=max(0, deadline - time.time()))
+        still_pending = []
+        for p in self.pending:
+            if p.future.done():
+                try:
+                    challenge = p.future.result()
+                except Exception as e:
+                    print(f"Error classifying {p.flag.flag} with LLM: {e}")
+                    if p.attempts >= self.max_attempts:
+                        self._resolve(p, None)
+                        continue
+                    p.attempts += 1
+                    p.future = self.pool.submit(self._classify, p.flag, p.challenges)
+                else:
+                    self.memo[p.key] = challenge
+                    self._resolve(p, challenge)
+                    continue
+            if not p.timed_out and time.time() >= p.deadline:
+                p.timed_out = True
+                p.on_result(p.flag, None, False)
+            still_pending.append(p)
+        self.pending = still_pending
+
+    def _resolve(self, p: PendingFlag, challenge: Optional[str]) -> None:
+        if not p.timed_out:
+            p.on_result(p.flag, challenge, False)
+        elif challenge:
+            p.on_result(p.flag, challenge, True)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,194 @@
+"""
+Process-wide metrics for the dispatch loop: counters, gauges and timers
+keyed by name and labels. They're exposed as Prometheus text on
+`metrics_port` and/or appended as JSON lines to `metrics_file` every
+`metrics_interval` seconds.
+
+    with metrics.timer("flagger_stage_seconds", stage="fetch", source="github"):
+        ...
+    metrics.inc("flagger_documents_total", source="github")
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Timer:
+    __slots__ = ("count", "sum", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.timers: Dict[str, Dict[Labels, Timer]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            timer = self.timers.setdefault(name, {}).get(key)
+            if timer is None:
+                timer = self.timers[name][key] = Timer()
+            timer.count += 1
+            timer.sum += seconds
+            timer.max = max(timer.max, seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        def series(metrics, value):
+            return {name: [{"labels": dict(labels), **value(v)} for labels, v in s.items()] for name, s in metrics.items()}
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": series(self.counters, lambda v: {"value": v}),
+                "gauges": series(self.gauges, lambda v: {"value": v}),
+                "timers": series(self.timers, lambda t: {"count": t.count, "sum": t.sum, "max": t.max}),
+            }
+
+    def prometheus(self) -> str:
+        def fmt(labels: Labels) -> str:
+            if not labels:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+        lines: List[str] = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, s in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines += [f"{name}{fmt(labels)} {value}" for labels, value in s.items()]
+            for name, s in sorted(self.timers.items()):
+                lines.append(f"# TYPE {name} summary")
+                for labels, t in s.items():
+                    lines += [f"{name}_count{fmt(labels)} {t.count}", f"{name}_sum{fmt(labels)} {t.sum}"]
+                lines.append(f"# TYPE {name}_max gauge")
+                lines += [f"{name}_max{fmt(labels)} {t.max}" for labels, t in s.items()]
+        return "\n".join(lines) + "\n"
+
+    def report(self, out: TextIO = sys.stdout) -> None:
+        """
+        Timers, slowest total first, as a table.
+        """
+        with self.lock:
+            rows = [(name, labels, t.count, t.sum, t.max) for name, s in self.timers.items() for labels, t in s.items()]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        rows = [(name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else name, *rest) for name, labels, *rest in rows]
+        width = max([len("timer")] + [len(row[0]) for row in rows])
+        print(f"{'timer':<{width}} {'count':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9}", file=out)
+        for label, count, total, longest in rows:
+            print(f"{label:<{width}} {count:>7} {total:>9.3f} {total / count * 1000:>9.1f} {longest * 1000:>9.1f}", file=out)
+
+METRICS = Metrics()
+inc = METRICS.inc
+gauge = METRICS.gauge
+observe = METRICS.observe
+timer = METRICS.timer
+
+def serve(port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """
+    Serves METRICS as Prometheus text on http://host:port/metrics from a daemon thread.
+    """
+    # only imported when the endpoint is turned on, it's slow to import
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = METRICS.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+class JsonLinesWriter:
+    """
+    Appends a snapshot of METRICS to `path` every `interval` seconds, and once
+    more on close.
+    """
+    def __init__(self, path: str, interval: float = 60):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self.thread.start()
+
+    def write(self) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(METRICS.snapshot()) + "\n")
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+class Exporters:
+    def __init__(self, server: Optional["ThreadingHTTPServer"], writer: Optional[JsonLinesWriter]):
+        self.server = server
+        self.writer = writer
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+        if self.writer is not None:
+            self.writer.close()
+
+def start(global_config: Dict[str, Any]) -> Exporters:
+    """
+    Starts whichever exporters the config asks for: `metrics_port` (and
+    `metrics_host`) for the Prometheus endpoint, `metrics_file` for JSON lines.
+    """
+    server = writer = None
+    if global_config.get("metrics_port"):
+        server = serve(global_config["metrics_port"], global_config.get("metrics_host", "127.0.0.1"))
+        print(f"Serving metrics on http://{global_config.get('metrics_host', '127.0.0.1')}:{global_config['metrics_port']}/metrics")
+    if global_config.get("metrics_file"):
+        writer = JsonLinesWriter(global_config["metrics_file"], global_config.get("metrics_interval", 60))
+    return Exporters(server, writer)
@@ -0,0 +1,60 @@
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+from . import fixtures
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 20)
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+
+def mount(session: requests.Session, adapter: BaseAdapter) -> None:
+    """
+    Mounts `adapter` for http and https, wrapped or replaced while fixtures
+    are recorded or replayed.
+    """
+    adapter = fixtures.wrap(adapter)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+def make_session(pool_size: int = 10, headers: Optional[Dict[str, str]] = None, hosts: Optional[int] = None) -> requests.Session:
+    """
+    `pool_size` is how many connections are kept per host, `hosts` how many
+    per-host pools are kept alive (defaults to `pool_size`).
+    """
+    s = requests.Session()
+    mount(s, HTTPAdapter(pool_connections=hosts or pool_size, pool_maxsize=pool_size))
+    if headers:
+        s.headers.update(headers)
+    return s
+
+class Fetched(NamedTuple):
+    # None when the server answered 304 Not Modified
+    body: Optional[bytes]
+    encoding: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+def fetch_capped(session: requests.Session, url: str, max_bytes: int = DEFAULT_MAX_BYTES, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Fetched:
+    """
+    Streams `url` and stops reading after `max_bytes`, so huge pages are
+    truncated instead of buffered whole. Passing the `etag`/`last_modified`
+    of a previous fetch makes the request conditional.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    with session.get(url, timeout=timeout, stream=True, headers=headers) as response:
+        response.raise_for_status()
+        validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        if response.status_code == 304:
+            return Fetched(None, response.encoding or "utf-8", etag, last_modified)
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+        return Fetched(b"".join(chunks)[:max_bytes], response.encoding or "utf-8", *validators)
@@ -0,0 +1,95 @@
+import threading
+import time
+from queue import Queue, Empty
+from typing import Any, Callable, Dict, List, Optional
+import requests
+from .net import make_session, DEFAULT_TIMEOUT
+from . import metrics
+
+# discord rejects messages with more than 10 embeds
+MAX_EMBEDS = 10
+_STOP = object()
+
+class DiscordNotifier:
+    """
+    Posts embeds to Discord webhooks from a background thread, batching up to
+    MAX_EMBEDS consecutive embeds for the same webhook into one message and
+    waiting out 429s. Embeds are delivered in the order they were sent, and
+    an embed's `on_sent` callback is called once Discord has accepted it.
+    """
+    def __init__(self, linger: float = 0.5, max_retries: int = 5):
+        self.linger = linger
+        self.max_retries = max_retries
+        self.session = make_session(2)
+        self.queue: Queue = Queue()
+        self.thread = threading.Thread(target=self._run, name="discord", daemon=True)
+        self.thread.start()
+
+    def send(self, endpoint: str, embed: Dict[str, Any], on_sent: Optional[Callable[[], None]] = None) -> None:
+        self.queue.put((endpoint, embed, on_sent))
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            item = pending if pending is not None else self.queue.get()
+            pending = None
+            if item is _STOP:
+                return
+            endpoint, embed, on_sent = item
+            embeds = [embed]
+            callbacks = [on_sent]
+            deadline = time.time() + self.linger
+            while len(embeds) < MAX_EMBEDS:
+                try:
+                    nxt = self.queue.get(timeout=max(0, deadline - time.time()))
+                except Empty:
+                    break
+                if nxt is _STOP or nxt[0] != endpoint:
+                    # starts the next batch, so ordering is kept
+                    pending = nxt
+                    break
+                embeds.append(nxt[1])
+                callbacks.append(nxt[2])
+            if not self._post(endpoint, embeds):
+                continue
+            for callback in filter(None, callbacks):
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error after posting to Discord: {e}")
+
+    def _post(self, endpoint: str, embeds: List[Dict[str, Any]]) -> bool:
+        """
+        Whether Discord accepted the embeds.
+        """
+        for _ in range(self.max_retries):
+            try:
+                with metrics.timer("flagger_stage_seconds", stage="discord"):
+                    r = self.session.post(endpoint, json={"embeds": embeds}, timeout=DEFAULT_TIMEOUT)
+            except requests.RequestException as e:
+                print(f"Error posting to Discord: {e}")
+                return False
+            if r.status_code == 429:
+                metrics.inc("flagger_discord_rate_limited_total")
+                retry_after = r.headers.get("Retry-After")
+                if retry_after is None:
+                    try:
+                        retry_after = r.json().get("retry_after", 1)
+                    except ValueError:
+                        retry_after = 1
+                time.sleep(float(retry_after))
+                continue
+            if not r.ok:
+                print(f"Error posting to Discord: {r.status_code} {r.text}")
+                return False
+            metrics.inc("flagger_discord_embeds_total", len(embeds))
+            return True
+        print(f"Giving up on Discord after {self.max_retries} rate limited attempts")
+        return False
+
+    def close(self, timeout: Optional[float] = 30) -> None:
+        """
+        Flushes everything queued so far and stops the worker.
+        """
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
@@ -0,0 +1,35 @@
+import importlib
+from importlib.metadata import entry_points
+from typing import Any, Dict, List
+
+class Registry:
+    """
+    Named implementations of a plugin type, imported only when first loaded.
+    Installed packages can add their own through the `group` entry point
+    group; `builtins` maps names to "module:attr" so flagger's own
+    implementations also work when running from a source checkout.
+    """
+    def __init__(self, group: str, builtins: Dict[str, str]):
+        self.group = group
+        self.builtins = builtins
+        self.loaded: Dict[str, Any] = {}
+
+    def _entry_points(self) -> Dict[str, Any]:
+        return {ep.name: ep for ep in entry_points(group=self.group)}
+
+    def names(self) -> List[str]:
+        return list(dict.fromkeys([*self.builtins, *self._entry_points()]))
+
+    def load(self, name: str) -> Any:
+        if name in self.loaded:
+            return self.loaded[name]
+        eps = self._entry_points()
+        if name in eps:
+            obj = eps[name].load()
+        elif name in self.builtins:
+            module, attr = self.builtins[name].split(":")
+            obj = getattr(importlib.import_module(module), attr)
+        else:
+            raise KeyError(f"No {self.group} named {name!r}, available: {', '.join(self.names())}")
+        self.loaded[name] = obj
+        return obj
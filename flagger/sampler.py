@@ -0,0 +1,107 @@
+"""
+Sampling profiler over every thread, for --profile. A background thread
+reads sys._current_frames() every `interval` seconds, so sniffer and fetch
+pool threads are profiled too, at a cost that doesn't grow with call counts
+the way cProfile's does.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from typing import List, Optional, TextIO, Tuple
+
+Frame = Tuple[str, int, str]
+
+# threads whose innermost frame is in these are parked on a lock or queue
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+# pool workers waiting for a task are blocked in C under this frame
+_IDLE_FRAMES = {(os.path.join("concurrent", "futures", "thread.py"), "_worker")}
+
+class Sampler:
+    """
+    With `idle` off, samples of threads parked on a lock, condition or queue
+    (idle pool workers, the scheduler waiting for flags) are dropped, so the
+    report shows where work is done. Threads blocked on sockets still count.
+    """
+    def __init__(self, interval: float = 0.005, max_depth: int = 64, idle: bool = False):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.idle = idle
+        self.samples = 0
+        # innermost frame -> samples, i.e. where the time is spent
+        self.own: Counter = Counter()
+        # frame anywhere on the stack -> samples it was part of
+        self.total: Counter = Counter()
+        # whole stacks, outermost first
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack: List[Frame] = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                frame = frame.f_back
+            if not stack or (not self.idle and self._is_idle(stack[0])):
+                continue
+            self.samples += 1
+            self.own[stack[0]] += 1
+            for f in {(filename, 0, name) for filename, _, name in stack}:
+                self.total[f] += 1
+            self.stacks[tuple(reversed(stack))] += 1
+
+    @staticmethod
+    def _is_idle(frame: Frame) -> bool:
+        filename, _, name = frame
+        return filename.endswith(_IDLE_FILES) or any(filename.endswith(f) and name == n for f, n in _IDLE_FRAMES)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "Sampler":
+        self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "Sampler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @staticmethod
+    def _where(frame: Frame) -> str:
+        filename, lineno, name = frame
+        where = os.path.relpath(filename) if not filename.startswith("<") else filename
+        return f"{name} ({where}:{lineno})" if lineno else f"{name} ({where})"
+
+    def report(self, top: int = 25, out: TextIO = sys.stdout) -> None:
+        if not self.samples:
+            print("No samples collected", file=out)
+            return
+        print(f"{self.samples} samples every {self.interval * 1000:.0f} ms across all threads", file=out)
+        print(f"\nTop {top} by own samples:", file=out)
+        for frame, n in self.own.most_common(top):
+            print(f"  {n / self.samples:6.1%}  {self._where(frame)}", file=out)
+        print(f"\nTop {top} by cumulative samples:", file=out)
+        for frame, n in self.total.most_common(top):
+            print(f"  {n / self.samples:6.1%}  {self._where(frame)}", file=out)
+
+    def dump_collapsed(self, path: str) -> None:
+        """
+        Writes the stacks in the collapsed format flamegraph.pl and speedscope read.
+        """
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(";".join(f"{name} ({os.path.basename(filename)}:{lineno})" for filename, lineno, name in stack) + f" {n}\n")
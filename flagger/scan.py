@@ -0,0 +1,236 @@
+"""
+The CPU-bound part of sniffing a document: decoding, the raw-bytes
+prefilter, HTML to text and regex scanning. With `cpu_workers` set in the
+global config, documents are handed to a process pool shared by every
+sniffer so scanning isn't serialized on the GIL; otherwise it runs on the
+calling thread.
+
+Workers get the raw bytes and send back compact records, (label, flag,
+window, first line, last line, pattern) per match, plus the text of the
+merged windows of lines around the matches, so every context is rebuilt as
+a reference into one window instead of being pickled separately, and the
+rest of the document never leaves the worker.
+"""
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from . import metrics
+from .extract import CONTEXT_LINES, ContextRef, Document, Extractor, literal_prefixes
+from .fingerprint import Match, flag_windows, open_index, simhash
+from .htmltext import get_extractor
+
+Formats = Tuple[Tuple[str, str], ...]
+
+class ScanResult(NamedTuple):
+    # text of the windows the contexts are in, empty when nothing matched
+    windows: List[str]
+    # (label, flag, window, first context line, end context line, pattern that matched), lines within the window
+    matches: List[Tuple[str, str, int, int, int, str]]
+    # False if the prefilter let the document skip parsing
+    parsed: bool
+    parse_seconds: float
+    extract_seconds: float
+
+# compiled extractors, per process
+_EXTRACTORS: Dict[Tuple[Formats, int], Extractor] = {}
+
+def _extractor(formats: Formats, context_lines: int) -> Extractor:
+    key = (formats, context_lines)
+    if key not in _EXTRACTORS:
+        _EXTRACTORS[key] = Extractor(list(formats), context_lines)
+    return _EXTRACTORS[key]
+
+def _encoded(prefixes: List[str], encoding: str) -> Optional[List[bytes]]:
+    try:
+        # UTF-16 and friends prepend a BOM, the bytes can't be searched for
+        if "<".encode(encoding) != b"<":
+            return None
+        return [prefix.encode(encoding) for prefix in prefixes]
+    except (LookupError, UnicodeError):
+        return None
+
+def worth_parsing(body: bytes, encoding: str, flag_start: Union[str, Tuple[str, ...]], extractor: Extractor) -> bool:
+    """
+    Cheap check on a raw page: it can only have flags if it contains the
+    literal prefix of one of the formats, and then only if it contains a
+    flag prefix (`flag_start` is one or a tuple of them) or, failing that,
+    something a format matches. Flags split up by markup or spelled with
+    character references are missed.
+    """
+    prefixes = extractor.prefixes
+    if prefixes is not None:
+        encoded = _encoded(prefixes, encoding)
+        # no regex or decoding needed to rule out most pages
+        if encoded is not None and not any(prefix in body for prefix in encoded):
+            return False
+    for start in (flag_start,) if isinstance(flag_start, str) else flag_start:
+        if not start:
+            continue
+        try:
+            if start.encode(encoding) in body:
+                return True
+        except (LookupError, UnicodeError):
+            pass
+    return extractor.search(body.decode(encoding, errors="replace"))
+
+def scan_document(formats: Formats, context_lines: int, body: bytes, encoding: str, html_extractor: Optional[str], flag_start: Union[str, Tuple[str, ...]], errors: str) -> ScanResult:
+    """
+    Runs in a worker process, or inline without a pool. `html_extractor` is
+    None for documents that are already text.
+    """
+    extractor = _extractor(formats, context_lines)
+    start = time.perf_counter()
+    if html_extractor is not None:
+        if not worth_parsing(body, encoding, flag_start, extractor):
+            return ScanResult([], [], False, 0.0, 0.0)
+        text = get_extractor(html_extractor)(body.decode(encoding, errors=errors))
+    else:
+        text = body.decode(encoding, errors=errors)
+    parsed = time.perf_counter()
+    # window Document -> its index in `windows`
+    windows: Dict[int, int] = {}
+    texts = []
+    matches = []
+    for label, pattern, flag, context in extractor.matches(text):
+        if id(context.doc) not in windows:
+            windows[id(context.doc)] = len(texts)
+            texts.append(context.doc.text)
+        matches.append((label, flag, windows[id(context.doc)], context.start, context.end, pattern))
+    done = time.perf_counter()
+    return ScanResult(texts, matches, True, parsed - start, done - parsed)
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+def cpu_pool(global_config: Dict[str, Any]) -> Optional[ProcessPoolExecutor]:
+    """
+    The process pool shared by every sniffer, or None if `cpu_workers` isn't set.
+    """
+    workers = global_config.get("cpu_workers", 0)
+    if not workers:
+        return None
+    with _POOLS_LOCK:
+        if workers not in _POOLS:
+            # sniffer threads are already running, forking them isn't safe
+            _POOLS[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _POOLS[workers]
+
+def shutdown() -> None:
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _POOLS.clear()
+
+class Scanner:
+    """
+    Scans documents for a sniffer's formats, in the shared process pool when
+    there is one. Records parse/extract timings and prefiltered documents
+    under the sniffer's name.
+
+    Documents already scanned by any sniffer, in this cycle or an earlier
+    one, are answered from the fingerprint index without being parsed.
+    Sniffers can `claim` fingerprints they know before fetching (a blob SHA,
+    a URL) and pass them to `scan` to have them recorded with the result,
+    or `record` what they kept of it themselves.
+    """
+    def __init__(self, formats: List[Tuple[str, str]], global_config: Dict[str, Any], source: str, context_lines: int = CONTEXT_LINES):
+        self.formats: Formats = tuple(tuple(f) for f in formats)
+        self.context_lines = context_lines
+        self.html_extractor = global_config.get("html_extractor", "auto")
+        # fail on a bad name now rather than in every worker
+        get_extractor(self.html_extractor)
+        self.pool = cpu_pool(global_config)
+        self.source = source
+        self.index = open_index(global_config)
+        self.near = global_config.get("dedupe_near", True)
+        # a result is only valid for the exact formats and context size it was scanned with
+        self.scope = json.dumps([self.formats, context_lines])
+        # matches only name the pattern that hit for labels with several formats
+        labels = [label for label, _ in self.formats]
+        self.multi = {label for label in labels if labels.count(label) > 1}
+        # near-duplicates are only trusted if every flag has to start with one of these
+        prefixes = [literal_prefixes(pattern) for _, pattern in self.formats]
+        self.prefixes = sorted({p for ps in prefixes for p in ps}) if all(ps is not None for ps in prefixes) else None
+
+    def _known(self, kind: str, matches: List[Match]) -> List[Tuple[str, str, ContextRef, str]]:
+        metrics.inc("flagger_duplicates_total", source=self.source, kind=kind)
+        # entries recorded before formats were stored have none
+        return [(label, flag, ContextRef.of(context), fmt[0] if fmt else "") for label, flag, context, *fmt in matches]
+
+    def claim(self, *fingerprints: str) -> Optional[List[Tuple[str, str, ContextRef, str]]]:
+        """
+        What an earlier scan found for any of `fingerprints`, or None with
+        them reserved until they're passed to `scan` or `release`d.
+        """
+        if self.index is None or not fingerprints:
+            return None
+        hit = self.index.claim(self.scope, list(fingerprints))
+        if hit is None:
+            return None
+        return self._known(hit[0].split(":", 1)[0], hit[1])
+
+    def release(self, *fingerprints: str) -> None:
+        if self.index is not None and fingerprints:
+            self.index.release(self.scope, fingerprints)
+
+    def record(self, fingerprints: Tuple[str, ...], matches: List[Match]) -> None:
+        """
+        Stores (label, flag, context, format) matches under claimed
+        `fingerprints`, for sniffers that filter what `scan` found.
+        """
+        if self.index is not None and fingerprints:
+            self.index.record(self.scope, fingerprints, matches)
+
+    def scan(self, body: bytes, encoding: str = "utf-8", html: bool = False, flag_start: Union[str, Tuple[str, ...]] = "", errors: str = "strict", fingerprints: Tuple[str, ...] = ()) -> List[Tuple[str, str, ContextRef, str]]:
+        """
+        (label, flag, context, format) for every match in `body`, the format
+        being the pattern that matched if the label has more than one.
+        """
+        if self.index is None:
+            return self._scan(body, encoding, html, flag_start, errors)
+        # the same bytes come out as different text with and without HTML parsing
+        content = f"sha256:{hashlib.sha256(body).hexdigest()}" + (":html" if html else "")
+        hit = self.index.claim(self.scope, [content])
+        if hit is not None:
+            self.index.record(self.scope, fingerprints, hit[1])
+            return self._known("content", hit[1])
+        fingerprints = (content, *fingerprints)
+        near = None
+        try:
+            starts = _encoded(self.prefixes, encoding) if self.near and html and self.prefixes else None
+            # pages without a prefix are cheap to prefilter anyway
+            if starts and any(start in body for start in starts):
+                near = (flag_windows(body, starts), simhash(body))
+                matches = self.index.near(self.scope, *near)
+                if matches is not None:
+                    self.index.record(self.scope, fingerprints, matches)
+                    return self._known("near", matches)
+            found = self._scan(body, encoding, html, flag_start, errors)
+            matches = [(label, flag, context.text(), fmt) for label, flag, context, fmt in found]
+            self.index.record(self.scope, fingerprints, matches)
+            if near is not None:
+                self.index.record_near(self.scope, *near, matches)
+            return found
+        finally:
+            self.index.release(self.scope, fingerprints)
+
+    def _scan(self, body: bytes, encoding: str, html: bool, flag_start: Union[str, Tuple[str, ...]], errors: str) -> List[Tuple[str, str, ContextRef, str]]:
+        args = (self.formats, self.context_lines, body, encoding, self.html_extractor if html else None, flag_start, errors)
+        if self.pool is None:
+            result = scan_document(*args)
+        else:
+            result = self.pool.submit(scan_document, *args).result()
+        if not result.parsed:
+            metrics.inc("flagger_prefiltered_total", source=self.source)
+            return []
+        if html:
+            metrics.observe("flagger_stage_seconds", result.parse_seconds, stage="parse", source=self.source)
+        metrics.observe("flagger_stage_seconds", result.extract_seconds, stage="extract", source=self.source)
+        if not result.matches:
+            return []
+        docs = [Document(text) for text in result.windows]
+        return [(label, flag, ContextRef(docs[window], start, end), pattern if label in self.multi else "") for label, flag, window, start, end, pattern in result.matches]
@@ -0,0 +1,159 @@
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue, Empty
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from .sniffers import Sniffer, Flag, FlagConsolidator
+from . import metrics
+
+@dataclass
+class Source:
+    sniffer: Sniffer
+    base_interval: float
+    interval: float
+    next_run: float = 0.0
+    future: Optional[Future] = None
+    consolidator: Optional[FlagConsolidator] = None
+    found: int = 0
+    new: int = 0
+    started: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.sniffer.name
+
+class Scheduler:
+    """
+    Runs every sniffer on its own cadence instead of one fixed interval.
+    A source that turns up new flags is polled more often (down to
+    `min_interval`), one that comes back empty backs off (up to
+    `max_interval`), and a source reporting low rate-limit headroom is slowed
+    down in proportion or held until its limit resets. A source never runs
+    again before its previous run has finished.
+
+    Flags are handed to `on_flags` as they stream in, batched per source by
+    whatever arrived since the loop last woke up; it returns how many of them
+    were new. Sniffers are told which flags were `handled` once `on_flags`
+    returns. `on_tick` is called every time the loop wakes up.
+    """
+    def __init__(self, sniffers: List[Sniffer], global_config: Dict[str, Any], on_flags: Callable[[Sniffer, List[Flag]], int], on_tick: Optional[Callable[[], None]] = None):
+        interval = global_config["interval"]
+        intervals = global_config.get("intervals", {})
+        self.min_factor = global_config.get("min_interval_factor", 0.5)
+        self.max_factor = global_config.get("max_interval_factor", 8)
+        self.backoff = global_config.get("backoff", 2)
+        # below this share of the rate limit left, wait for the reset
+        self.low_headroom = global_config.get("low_headroom", 0.05)
+        self.sources = []
+        for sniffer in sniffers:
+            base = intervals.get(sniffer.__class__.__name__, interval)
+            self.sources.append(Source(sniffer, base, base))
+        self.on_flags = on_flags
+        self.on_tick = on_tick
+        # (source, flag) from the sniffer threads, (source, None) once a run is over
+        self.queue: Queue = Queue()
+        self.pool = ThreadPoolExecutor(max_workers=global_config.get("max_workers", len(sniffers)), thread_name_prefix="sniffer")
+
+    def _run_source(self, source: Source) -> None:
+        try:
+            for flag in source.sniffer.sniff():
+                self.queue.put((source, flag))
+        finally:
+            self.queue.put((source, None))
+
+    def _adapt(self, source: Source, new: int) -> None:
+        if new:
+            source.interval = max(source.base_interval * self.min_factor, source.interval / self.backoff)
+        else:
+            source.interval = min(source.base_interval * self.max_factor, source.interval * self.backoff)
+        now = time.time()
+        delay = source.interval
+        rate_limit = source.sniffer.rate_limit
+        if rate_limit is not None and rate_limit.limit:
+            headroom = rate_limit.remaining / rate_limit.limit
+            if headroom < self.low_headroom:
+                delay = max(delay, rate_limit.reset - now)
+            else:
+                delay = min(source.base_interval * self.max_factor, delay / headroom)
+        source.next_run = now + delay
+
+    def _handle(self, source: Source, flags: List[Flag]) -> None:
+        try:
+            source.new += self.on_flags(source.sniffer, flags)
+            # a batch that failed is picked up again by the source's next run
+            source.sniffer.handled(flags)
+        except Exception as e:
+            print(f"Error handling flags from {source.name}: {e}")
+            traceback.print_exception(e)
+
+    def _finish(self, source: Source) -> None:
+        future, source.future = source.future, None
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error in {source.name}: {e}")
+            traceback.print_exception(e)
+        self._adapt(source, source.new)
+        metrics.observe("flagger_cycle_seconds", time.time() - source.started, source=source.name)
+        metrics.inc("flagger_flags_found_total", source.found, source=source.name)
+        metrics.inc("flagger_flags_new_total", source.new, source=source.name)
+        metrics.gauge("flagger_interval_seconds", source.interval, source=source.name)
+        print(f"{source.name}: {source.found} flags, {source.new} new, next run in {source.next_run - time.time():.0f}s")
+
+    def _start(self, source: Source) -> None:
+        source.consolidator = FlagConsolidator()
+        source.found = source.new = 0
+        source.started = time.time()
+        source.sniffer.stopping.clear()
+        source.future = self.pool.submit(self._run_source, source)
+
+    def run_once(self, timeout: float = 0) -> None:
+        """
+        Starts every source that is due, then handles whatever flags and
+        finished runs came in, waiting up to `timeout` for the first one.
+        """
+        now = time.time()
+        for source in self.sources:
+            if source.future is None and source.next_run <= now:
+                self._start(source)
+        items = []
+        try:
+            items.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            while True:
+                items.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        batches: Dict[int, List[Flag]] = {}
+        finished = []
+        for source, flag in items:
+            if flag is None:
+                finished.append(source)
+                continue
+            # drop repeats within a run before they go downstream
+            flag = source.consolidator.add(flag)
+            if flag is not None:
+                source.found += 1
+                batches.setdefault(id(source), []).append(flag)
+        for source in self.sources:
+            if id(source) in batches:
+                self._handle(source, batches[id(source)])
+        # a run's flags are always queued before its end marker, so they've all been handled
+        for source in finished:
+            self._finish(source)
+        if self.on_tick is not None:
+            self.on_tick()
+
+    def run_forever(self, max_sleep: float = 1.0) -> None:
+        while True:
+            idle = [s.next_run for s in self.sources if s.future is None]
+            timeout = max_sleep
+            if idle:
+                timeout = min(timeout, max(0, min(idle) - time.time()))
+            self.run_once(timeout)
+
+    def close(self) -> None:
+        # runs in flight would otherwise hold up exiting until they're done
+        for source in self.sources:
+            source.sniffer.stop()
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -1,33 +1,181 @@
-from typing import Dict, List, Any
+import threading
+from typing import Dict, Iterable, Iterator, List, Any, NamedTuple, Optional, Tuple, Union
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from ..cache import open_cache
+from ..extract import ContextRef
+from ..scan import Scanner
+from ..registry import Registry
+
+# contexts kept per flag, however many places it turns up in
+MAX_CONTEXTS = 5
 
-@dataclass
 class Flag:
-    flag: str
-    origin: str
-    context: str
+    """
+    A flag value and where it was found. Sightings of the same flag are
+    merged into one Flag holding the set of origins and up to MAX_CONTEXTS
+    distinct contexts, each a reference into its document.
+    """
+    __slots__ = ("flag", "ctf", "format", "origins", "contexts")
+
+    def __init__(self, flag: str, origin: str, context: Union[str, ContextRef], ctf: str = "", fmt: str = ""):
+        self.flag = flag
+        # name of the CTF whose flag format matched
+        self.ctf = ctf
+        # the pattern that matched, for CTFs with several formats
+        self.format = fmt
+        # dicts keep insertion order, so origins read back in the order they were found
+        self.origins: Dict[str, None] = {origin: None}
+        self.contexts: List[ContextRef] = [ContextRef.of(context) if isinstance(context, str) else context]
+
+    @property
+    def origin(self) -> str:
+        return ", ".join(self.origins)
+
+    @property
+    def context(self) -> str:
+        return " ".join(ref.text() for ref in self.contexts)
+
+    def merge(self, other: "Flag") -> None:
+        self.origins.update(other.origins)
+        keys = {ref.key for ref in self.contexts}
+        for ref in other.contexts:
+            if len(self.contexts) >= MAX_CONTEXTS:
+                break
+            if ref.key not in keys:
+                keys.add(ref.key)
+                self.contexts.append(ref)
+
+    def copy(self) -> "Flag":
+        flag = Flag.__new__(Flag)
+        flag.flag = self.flag
+        flag.ctf = self.ctf
+        flag.format = self.format
+        flag.origins = dict(self.origins)
+        flag.contexts = list(self.contexts)
+        return flag
+
+    def __repr__(self) -> str:
+        return f"Flag({self.flag!r}, {self.origin!r}, ctf={self.ctf!r}, contexts={len(self.contexts)})"
+
+def patterns_of(config: Dict[str, Any]) -> List[str]:
+    """
+    A CTF's flag formats: `flag_re` is one pattern or a list of them.
+    """
+    flag_re = config["flag_re"]
+    return [flag_re] if isinstance(flag_re, str) else list(flag_re)
+
+def formats_of(config: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    (ctf name, pattern) pairs a sniffer scans for, one per flag format.
+    Sniffers shared by several CTFs get a merged config listing them under
+    "formats".
+    """
+    if "formats" in config:
+        return [tuple(f) for f in config["formats"]]
+    return [(config.get("name", ""), pattern) for pattern in patterns_of(config)]
+
+def queries_of(config: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    (search, flag_start) pairs a sniffer searches for. Everything the
+    searches turn up goes through one fetch and scan stage, scanned for all
+    of the sniffer's formats.
+    """
+    if "queries" in config:
+        return [tuple(q) for q in config["queries"]]
+    return [(config["search"], config["flag_start"])]
+
+def flags_from(matches: Iterable[Tuple], origin: str) -> List[Flag]:
+    """
+    Flags for (ctf, flag, context, format) matches, as scanned or read back
+    from a cache. Entries cached before formats were recorded have no format.
+    """
+    return [Flag(flag, origin, context, ctf, *fmt) for ctf, flag, context, *fmt in matches]
+
+class RateLimit(NamedTuple):
+    remaining: int
+    limit: int
+    # unix time the limit resets at
+    reset: float
 
 class Sniffer(ABC):
     def __init__(self, global_config: Dict[str, Any], config: Dict[str, Any]):
         self.global_config = global_config
         self.config = config
+        self.cache = open_cache(global_config)
+        self.formats = formats_of(config)
+        self.queries = queries_of(config)
+        self.scanner = Scanner(self.formats, global_config, self.name)
+        # cache entries are only valid for the exact set of formats scanned for
+        self.formats_key = "\n".join(f"{name}\0{pattern}" for name, pattern in self.formats)
+        # latest rate limit reported by the source, if it has one
+        self.rate_limit: Optional[RateLimit] = None
+        # set to cut a run short, cleared by whoever starts the next one
+        self.stopping = threading.Event()
     
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
     @abstractmethod
-    def sniff(self) -> List[Flag]:
+    def sniff(self) -> Iterator[Flag]:
+        """
+        Yields flags as they're found, so they can be handled before the
+        whole search is done.
+        """
+        pass
+
+    def stop(self) -> None:
+        """
+        Asks a running `sniff` to wrap up: no more requests or backoffs, and
+        work not started yet is dropped. Documents being fetched finish.
+        """
+        self.stopping.set()
+
+    def handled(self, flags: List[Flag]) -> None:
+        """
+        Called once `flags` have been stored downstream, so a sniffer that
+        remembers what it has already looked at only does so for documents
+        whose flags can't be lost anymore.
+        """
         pass
 
-def consolidate_flags(flags: List[Flag]) -> List[Flag]:
-    consolidated = {}
+class FlagConsolidator:
+    """
+    Incremental version of `consolidate_flags`: `add` returns a flag the
+    first time its value is seen, and merges later sightings into it.
+    """
+    def __init__(self):
+        self.consolidated: Dict[Tuple[str, str], Flag] = {}
+
+    def add(self, flag: Flag) -> Optional[Flag]:
+        key = (flag.ctf, flag.flag)
+        if key in self.consolidated:
+            self.consolidated[key].merge(flag)
+            return None
+        self.consolidated[key] = flag.copy()
+        return self.consolidated[key]
+
+    def flags(self) -> List[Flag]:
+        return list(self.consolidated.values())
+
+def consolidate_flags(flags: Iterable[Flag]) -> List[Flag]:
+    consolidator = FlagConsolidator()
     for flag in flags:
-        if flag.flag in consolidated:
-            consolidated[flag.flag].origin += f", {flag.origin}"
-            consolidated[flag.flag].context += f" {flag.context}"
-        else:
-            consolidated[flag.flag] = Flag(flag.flag, flag.origin, flag.context)
-    return list(consolidated.values())
+        consolidator.add(flag)
+    return consolidator.flags()
+
+SNIFFERS = Registry("flagger.sniffers", {
+    "github": "flagger.sniffers.github:GithubSniffer",
+    "duckduckgo": "flagger.sniffers.duckduckgo:DuckSniffer",
+})
+DEFAULT_SNIFFERS = ["github", "duckduckgo"]
 
-from .github import GithubSniffer
-from .duckduckgo import DuckSniffer
+_LAZY = {"GithubSniffer": "github", "DuckSniffer": "duckduckgo"}
 
-ALL_SNIFFERS = [GithubSniffer, DuckSniffer]
\ No newline at end of file
+def __getattr__(name: str):
+    # sniffer modules pull in their dependencies, only import them when asked for
+    if name in _LAZY:
+        return SNIFFERS.load(_LAZY[name])
+    if name == "ALL_SNIFFERS":
+        return [SNIFFERS.load(sniffer) for sniffer in DEFAULT_SNIFFERS]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,53 +1,93 @@
-from . import Sniffer, Flag
+from . import Sniffer, Flag, flags_from
+from ..net import make_session, fetch_capped, DEFAULT_MAX_BYTES
+from ..cache import FetchCache
+from ..fingerprint import normalize_url
+from .. import fixtures, metrics
 import requests
 from datetime import datetime
 from tqdm import tqdm
-import re
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List
 
 class DuckSniffer(Sniffer):
     def __init__(self, global_config, config):
         super().__init__(global_config, config)
         self.after_date = datetime.strptime(config["start"], "%Y-%m-%dT%H:%M:%SZ")
-    
-    def sniff(self):
+        self.workers = global_config.get("web_workers", 16)
+        self.timeout = (global_config.get("web_connect_timeout", 5), global_config.get("web_read_timeout", 15))
+        self.max_bytes = global_config.get("web_max_bytes", DEFAULT_MAX_BYTES)
+        self.session = make_session(self.workers, headers={"User-Agent": "Mozilla/5.0"}, hosts=100)
+        # any of them makes a page worth parsing
+        self.flag_starts = tuple(flag_start for _, flag_start in self.queries if flag_start)
+
+    def _fetch(self, item) -> List[Flag]:
         flags = []
-        with DDGS() as ddgs:
-            search_query = f"{self.config['search']} {self.config['flag_start']}"
-            results = list(ddgs.text(search_query, max_results=100))
-            
-            if not results:
+        claimed = ()
+        if self.stopping.is_set():
+            return flags
+        try:
+            # duckduckgo_search calls the result's URL "href"
+            url = item.get('href') or item.get('url')
+            if not url:
                 return flags
+            # the same page under another scheme, host alias or tracking parameters
+            fingerprints = (f"url:{normalize_url(url)}",)
+            known = self.scanner.claim(*fingerprints)
+            if known is not None:
+                return flags_from(known, url)
+            claimed = fingerprints
+            key = FetchCache.key(url, self.formats_key)
+            entry = self.cache.get(key) if self.cache else None
+            with metrics.timer("flagger_stage_seconds", stage="fetch", source=self.name):
+                fetched = fetch_capped(self.session, url, self.max_bytes, self.timeout,
+                                       etag=entry.etag if entry else None, last_modified=entry.last_modified if entry else None)
+            if fetched.body is None:
+                # 304, the page hasn't changed since we last scanned it
+                metrics.inc("flagger_cache_hits_total", source=self.name)
+                return flags_from(entry.matches, url)
+            metrics.inc("flagger_documents_total", source=self.name)
+
+            # pages without the flag prefix or a regex match anywhere aren't parsed
+            flags = flags_from(self.scanner.scan(fetched.body, fetched.encoding, html=True, flag_start=self.flag_starts, errors='replace', fingerprints=fingerprints), url)
+
+            if self.cache:
+                self.cache.put(key, [(flag.ctf, flag.flag, flag.context, flag.format) for flag in flags], etag=fetched.etag, last_modified=fetched.last_modified)
+        
+        except (requests.RequestException, LookupError, ValueError):
+            # ValueError: a URL normalize_url can't parse, e.g. a bad port
+            pass
+        finally:
+            self.scanner.release(*claimed)
+        return flags
+    
+    def _search(self, search_query: str) -> List:
+        def search():
+            from duckduckgo_search import DDGS
+            with DDGS() as ddgs:
+                return list(ddgs.text(search_query, max_results=100))
+
+        with metrics.timer("flagger_stage_seconds", stage="search", source=self.name):
+            return fixtures.recorded("duckduckgo", search_query, search) or []
+
+    def sniff(self) -> Iterator[Flag]:
+        # one search per query, every page fetched once however many turn it up
+        results = {}
+        for search, flag_start in self.queries:
+            if self.stopping.is_set():
+                return
+            for item in self._search(f"{search} {flag_start}"):
+                results.setdefault(item.get('href') or item.get('url'), item)
+        results = list(results.values())
+
+        if not results:
+            return
 
-            for item in tqdm(results):
-                try:
-                    
-                    page_response = requests.get(item['url'])
-                    page_response.raise_for_status()
-                    
-                    soup = BeautifulSoup(page_response.text, 'html.parser')
-                    content = soup.get_text()
-                    
-                    r = re.compile(self.config['flag_re'])
-                    matches = r.findall(content)
-                    
-                    for flag in matches:
-                        lines = content.splitlines()
-                        flag_line = -1
-                        for i, line in enumerate(lines):
-                            if flag in line:
-                                flag_line = i
-                                break
-                                
-                        if flag_line != -1:
-                            start = max(0, flag_line - 50)
-                            end = min(len(lines), flag_line + 50)
-                            context = "\n".join(lines[start:end])
-                            flags.append(Flag(flag, item['url'], context))
-                
-                except (requests.RequestException, KeyError):
-                    continue
-
-        return flags
\ No newline at end of file
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="duck")
+        try:
+            futures = [pool.submit(self._fetch, item) for item in results]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                if self.stopping.is_set():
+                    break
+                yield from future.result()
+        finally:
+            pool.shutdown(wait=not self.stopping.is_set(), cancel_futures=True)
@@ -1,71 +1,244 @@
-from . import Sniffer, Flag
+from . import Sniffer, Flag, RateLimit, flags_from
+from ..net import make_session, DEFAULT_TIMEOUT
+from ..cache import FetchCache
+from .. import metrics
 
 import requests
 from urllib.parse import quote
 import json
-import re
 from tqdm import tqdm
 import base64
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 class GithubSniffer(Sniffer):
+    # the rate limit is per token, so it's shared by every GithubSniffer and
+    # fetch thread: one rate-limited response pauses all of them
+    _paused_until = 0.0
+    _pause_lock = threading.Lock()
+
     def __init__(self, global_config, config):
         super().__init__(global_config, config)
         self.token = global_config["keys"]["github"]
-        self.after_date = datetime.strptime(config["start"], "%Y-%m-%dT%H:%M:%SZ")
-    
-    def sniff(self):
-        headers = {
+        # per CTF for sniffers shared by several, see merge_configs
+        starts = config.get("starts", {config.get("name", ""): config["start"]})
+        self.starts = {name: datetime.strptime(start, "%Y-%m-%dT%H:%M:%SZ") for name, start in starts.items()}
+        self.after_date = min(self.starts.values())
+        self.workers = global_config.get("github_workers", 8)
+        self.max_backoff = global_config.get("github_max_backoff", 60)
+        self.max_retries = global_config.get("github_max_retries", 3)
+        self.session = make_session(self.workers, headers={
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {self.token}",
             "X-GitHub-Api-Version": "2022-11-28"
-        }
-        search_query = quote(f"{self.config['search']} {self.config['flag_start']} ", safe='')
-        
-        response = requests.get(
-            f"https://api.github.com/search/code?q={search_query}",
-            headers=headers
-        )
-        response.raise_for_status()
-        repos = response.json()
-        with open('test.json', 'w') as f:
-            json.dump(repos, f)
-        
+        })
+        self.max_pages = global_config.get("github_max_pages", 5)
+        self.incremental = global_config.get("github_incremental", True)
+        # like cache entries, a cursor is only valid for the formats its hits were scanned for
+        formats = hashlib.sha256(self.formats_key.encode()).hexdigest()[:16]
+        self.cursor_path = os.path.join(global_config.get("state_dir", "."), f"github_cursor_{config.get('name', 'default')}_{formats}.json")
+        self.seen = self._load_cursor() if self.incremental else set()
+        # hits whose flags haven't been handled downstream yet -> (ctf, flag)s still pending
+        self.unacked: Dict[Tuple[str, str, str], Set[Tuple[str, str]]] = {}
+        # (ctf, flag)s handled during the current run
+        self.acked: Set[Tuple[str, str]] = set()
+        self.cursor_lock = threading.Lock()
+
+    def _load_cursor(self) -> Set[Tuple[str, str, str]]:
+        if not os.path.exists(self.cursor_path):
+            return set()
+        with open(self.cursor_path, "r") as f:
+            return {tuple(item) for item in json.load(f)}
+
+    def _save_cursor(self) -> None:
+        # called with cursor_lock held
+        tmp = self.cursor_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(sorted(self.seen), f)
+        os.replace(tmp, self.cursor_path)
+
+    @staticmethod
+    def _cursor_key(repo) -> Tuple[str, str, str]:
+        return (repo['repository']['full_name'], repo['path'], repo.get('sha', ''))
+
+    def _backoff_for(self, response: requests.Response) -> Optional[float]:
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            return reset - time.time()
+        return None
+
+    def _get(self, url: str, **kwargs) -> Optional[requests.Response]:
+        for _ in range(self.max_retries + 1):
+            delay = GithubSniffer._paused_until - time.time()
+            # a backoff can be a minute long, don't sit it out when shutting down
+            if self.stopping.wait(max(delay, 0)):
+                return None
+            with metrics.timer("flagger_request_seconds", source=self.name):
+                response = self.session.get(url, timeout=DEFAULT_TIMEOUT, **kwargs)
+            if "X-RateLimit-Remaining" in response.headers:
+                self.rate_limit = RateLimit(
+                    int(response.headers["X-RateLimit-Remaining"]),
+                    int(response.headers.get("X-RateLimit-Limit", 0)),
+                    float(response.headers.get("X-RateLimit-Reset", 0))
+                )
+                metrics.gauge("flagger_rate_limit_remaining", self.rate_limit.remaining, source=self.name)
+            backoff = self._backoff_for(response)
+            if backoff is None:
+                response.raise_for_status()
+                return response
+            backoff = min(max(backoff, 1), self.max_backoff)
+            with GithubSniffer._pause_lock:
+                GithubSniffer._paused_until = max(GithubSniffer._paused_until, time.time() + backoff)
+            print(f"GitHub rate limit hit, backing off for {backoff:.0f}s")
+        print(f"GitHub still rate limited, skipping {url}")
+        return None
+
+    def _fetch(self, repo) -> Optional[List[Flag]]:
+        origin = f"https://github.com/{repo['repository']['full_name']}"
+        # the blob SHA from the search hit changes whenever the file does
+        key = FetchCache.key(f"{repo['repository']['full_name']}/{repo['path']}", self.formats_key)
+        if self.cache and repo.get('sha'):
+            entry = self.cache.hit(key, repo['sha'])
+            if entry is not None:
+                metrics.inc("flagger_cache_hits_total", source=self.name)
+                return flags_from(entry.matches, origin)
+        # forks and copies of the file share its blob SHA, whichever is seen first gets scanned
+        fingerprints = (f"blob:{repo['sha']}",) if repo.get('sha') else ()
+        known = self.scanner.claim(*fingerprints)
+        if known is not None:
+            return flags_from(known, origin)
+        try:
+            with metrics.timer("flagger_stage_seconds", stage="fetch", source=self.name):
+                flags = self._scan(repo, origin, fingerprints)
+        finally:
+            self.scanner.release(*fingerprints)
+        if flags is not None and self.cache and repo.get('sha'):
+            self.cache.put(key, [(flag.ctf, flag.flag, flag.context, flag.format) for flag in flags], validator=repo['sha'])
+        return flags
+
+    def _scan(self, repo, origin: str, fingerprints: Tuple[str, ...] = ()) -> Optional[List[Flag]]:
         flags = []
-        
-        for repo in tqdm(repos["items"]):
-            commits_url = f"https://api.github.com/repos/{repo['repository']['full_name']}/commits"
-            params = {'path': repo['path'], 'per_page': 1}  # Get latest commit only
-            commit_response = requests.get(commits_url, headers=headers, params=params)
-            commit_response.raise_for_status()
-            commits = commit_response.json()
-            
-            if commits:
-                last_modified = datetime.strptime(commits[0]['commit']['committer']['date'], '%Y-%m-%dT%H:%M:%SZ')
-                if last_modified < self.after_date:
-                    continue
+        commits_url = f"https://api.github.com/repos/{repo['repository']['full_name']}/commits"
+        params = {'path': repo['path'], 'per_page': 1}  # Get latest commit only
+        commit_response = self._get(commits_url, params=params)
+        if commit_response is None:
+            return None
+        commits = commit_response.json()
+
+        last_modified = None
+        if commits:
+            last_modified = datetime.strptime(commits[0]['commit']['committer']['date'], '%Y-%m-%dT%H:%M:%SZ')
+            if last_modified < self.after_date:
+                return flags
+
+        response = self._get(f"https://api.github.com/repos/{repo['repository']['full_name']}/contents/{repo['path']}")
+        if response is None:
+            return None
+        content = response.json()
+        content = base64.b64decode(content['content'])
+        metrics.inc("flagger_documents_total", source=self.name)
+        # a stray invalid byte shouldn't make the file fail, and be refetched, every cycle
+        flags += flags_from(self.scanner.scan(content, errors='replace'), origin)
+        if last_modified is not None:
+            # a CTF that started after the file was last changed can't have its flags in it
+            flags = [flag for flag in flags if last_modified >= self.starts.get(flag.ctf, self.after_date)]
+        # copies of the blob get what's left, not what a CTF it's too old for would have
+        self.scanner.record(fingerprints, [(flag.ctf, flag.flag, flag.context, flag.format) for flag in flags])
+        return flags
+
+    def _safe_fetch(self, repo) -> Optional[List[Flag]]:
+        try:
+            return self._fetch(repo)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            print(f"Error fetching {repo.get('html_url', repo.get('path'))}: {e}")
+            return None
 
-            response = requests.get(
-                f"https://api.github.com/repos/{repo['repository']['full_name']}/contents/{repo['path']}",
-                headers=headers
-            )
-            response.raise_for_status()
-            content = response.json()
-            content = base64.b64decode(content['content']).decode('utf-8')
-            r = re.compile(self.config['flag_re'])
-            res = r.findall(content)
-            for flag in res:
-                # get -50/+50 lines around the flag
-                flag_line = -1
-                for i, line in enumerate(content.splitlines()):
-                    if flag in line:
-                        flag_line = i
-                        break
-                if flag_line == -1:
+    def _search(self, search: str, flag_start: str) -> List:
+        search_query = quote(f"{search} {flag_start} ", safe='')
+        items = []
+        for page in range(1, self.max_pages + 1):
+            response = self._get(f"https://api.github.com/search/code?q={search_query}&per_page=100&page={page}")
+            if response is None:
+                break
+            res = response.json()
+            items += res["items"]
+            if len(res["items"]) < 100 or len(items) >= res.get("total_count", float("inf")):
+                break
+        return items
+
+    def sniff(self) -> Iterator[Flag]:
+        # one search per query, every hit fetched once however many turn it up
+        items = {}
+        for search, flag_start in self.queries:
+            with metrics.timer("flagger_stage_seconds", stage="search", source=self.name):
+                for repo in self._search(search, flag_start):
+                    items.setdefault(self._cursor_key(repo), repo)
+        items = list(items.values())
+        # hits handled in an earlier cycle are dropped before any per-item API calls
+        items = [repo for repo in items if self._cursor_key(repo) not in self.seen]
+        with self.cursor_lock:
+            # hits left unacked by the last run are fetched again, cheaply through the caches
+            self.unacked.clear()
+            self.acked.clear()
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="github")
+        try:
+            futures = {pool.submit(self._safe_fetch, repo): repo for repo in items}
+            # hand each hit's flags downstream as soon as it's been fetched
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                if self.stopping.is_set():
+                    break
+                res = future.result()
+                if res is None:
+                    # retried next cycle
                     continue
-                start = max(0, flag_line - 50)
-                end = min(len(content.splitlines()), flag_line + 50)
-                content = "\n".join(content.splitlines()[start:end])
-                flags.append(Flag(flag, f"https://github.com/{repo['repository']['full_name']}", content))
+                if self.incremental:
+                    self._track(self._cursor_key(futures[future]), res)
+                yield from res
+        finally:
+            # hits not fetched yet are picked up by the next run
+            pool.shutdown(wait=not self.stopping.is_set(), cancel_futures=True)
+
+        if self.incremental and items:
+            with self.cursor_lock:
+                self._save_cursor()
+
+    def _track(self, key: Tuple[str, str, str], flags: List[Flag]) -> None:
+        """
+        Adds a fetched hit to the cursor once its flags have been handled, or
+        right away if it had none. A flag already handled in this run counts,
+        since repeats are dropped before they go downstream.
+        """
+        with self.cursor_lock:
+            pending = {(flag.ctf, flag.flag) for flag in flags} - self.acked
+            if pending:
+                self.unacked[key] = pending
+            else:
+                self.seen.add(key)
 
-        return flags
\ No newline at end of file
+    def handled(self, flags: List[Flag]) -> None:
+        if not self.incremental:
+            return
+        values = {(flag.ctf, flag.flag) for flag in flags}
+        with self.cursor_lock:
+            self.acked |= values
+            done = []
+            for key, pending in self.unacked.items():
+                pending -= values
+                if not pending:
+                    done.append(key)
+            for key in done:
+                del self.unacked[key]
+                self.seen.add(key)
+            if done:
+                self._save_cursor()
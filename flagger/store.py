@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+DEFAULT_DB_PATH = "flagger.sqlite"
+
+class FlagStore:
+    """
+    Durable record of every flag found, shared by all CTFs (and processes)
+    using the same database file. Each write is committed as it happens; in
+    WAL mode with synchronous=NORMAL commits only fsync at checkpoints, so a
+    crash or SIGTERM keeps everything but a power cut can lose the last few.
+
+    A flag is added as soon as it's found but only marked reported once its
+    notification has gone out, so flags still waiting on the LLM or queued
+    for Discord when the process died can be picked up again with
+    `unreported`.
+    """
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS flags (
+                ctf TEXT NOT NULL,
+                flag TEXT NOT NULL,
+                origin TEXT,
+                challenge TEXT,
+                found_at REAL NOT NULL,
+                classified_at REAL,
+                context TEXT,
+                format TEXT,
+                reported_at REAL,
+                PRIMARY KEY (ctf, flag)
+            )
+        """)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(flags)")}
+        for column, kind in (("context", "TEXT"), ("format", "TEXT"), ("reported_at", "REAL")):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE flags ADD COLUMN {column} {kind}")
+        if "reported_at" not in columns:
+            # flags from before reporting was tracked went out when they were found
+            self.db.execute("UPDATE flags SET reported_at = found_at")
+        self.db.commit()
+
+    def seen(self, ctf: str, flag: str) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM flags WHERE ctf = ? AND flag = ?", (ctf, flag)).fetchone() is not None
+
+    def add(self, ctf: str, flag: str, origin: Optional[str] = None, context: Optional[str] = None, fmt: Optional[str] = None) -> bool:
+        """
+        Records a newly found flag. Returns False if it was already known.
+        """
+        with self.lock:
+            cur = self.db.execute("INSERT OR IGNORE INTO flags (ctf, flag, origin, found_at, context, format) VALUES (?, ?, ?, ?, ?, ?)", (ctf, flag, origin, time.time(), context, fmt))
+            self.db.commit()
+            return cur.rowcount == 1
+
+    def set_challenge(self, ctf: str, flag: str, challenge: Optional[str]) -> None:
+        with self.lock:
+            self.db.execute("UPDATE flags SET challenge = ?, classified_at = ? WHERE ctf = ? AND flag = ?", (challenge, time.time(), ctf, flag))
+            self.db.commit()
+
+    def mark_reported(self, ctf: str, flag: str) -> None:
+        with self.lock:
+            self.db.execute("UPDATE flags SET reported_at = ? WHERE ctf = ? AND flag = ? AND reported_at IS NULL", (time.time(), ctf, flag))
+            self.db.commit()
+
+    def unreported(self, ctf: str) -> List[Tuple[str, str, str, str]]:
+        """
+        (flag, origin, context, format) of flags that were found but never reported.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT flag, origin, context, format FROM flags WHERE ctf = ? AND reported_at IS NULL ORDER BY found_at", (ctf,)).fetchall()
+        return [(flag, origin or "", context or "", fmt or "") for flag, origin, context, fmt in rows]
+
+    def flags(self, ctf: str) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT flag FROM flags WHERE ctf = ? ORDER BY found_at", (ctf,))]
+
+    def import_legacy(self, ctf: str, path: str) -> int:
+        """
+        Imports a flags_found_<name>.txt file from older versions.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r") as f:
+            flags = [line.strip() for line in f if line.strip()]
+        now = time.time()
+        with self.lock:
+            cur = self.db.executemany("INSERT OR IGNORE INTO flags (ctf, flag, found_at, reported_at) VALUES (?, ?, ?, ?)", [(ctf, flag, now, now) for flag in flags])
+            self.db.commit()
+            return cur.rowcount
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()